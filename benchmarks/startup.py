@@ -0,0 +1,108 @@
+"""Time to first window of the GUI as the number of simulations grows
+
+Each measurement runs in a new interpreter, so imports are paid for as they would be on a real start. The simulations
+directory is filled with copies of the real simulation modules to reach each count:
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/startup.py --counts 4 25 100
+"""
+
+import argparse
+import json
+import pathlib
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+def measure(directory: str) -> dict:
+    # Runs in the child interpreter
+    start = time.perf_counter()
+    sys.path.insert(0, str(ROOT))
+
+    from PySide6.QtWidgets import QApplication
+
+    import main
+    from gui import main_window
+    from simulations import registry
+
+    app = QApplication([])
+    simulations = registry.get_simulations(pathlib.Path(directory))
+    window = main_window.MainWindow(main.get_icon_file(), simulations)
+    window.show()
+    window_time = time.perf_counter() - start
+    loaded_at_window = {module: module in sys.modules for module in ("numpy", "matplotlib")}
+
+    # The first simulation is shown by the first pass of the event loop
+    app.processEvents()
+    first_simulation_time = time.perf_counter() - start
+
+    return {
+        "simulations": len(simulations),
+        "window": window_time,
+        "first_simulation": first_simulation_time,
+        "loaded_at_window": loaded_at_window,
+    }
+
+
+def fill_directory(directory: pathlib.Path, count: int) -> None:
+    from simulations import registry
+
+    # The real modules come first when sorted, so the first button still imports a simulation that exists
+    sources = registry.get_simulation_files(ROOT / "simulations")
+    for file in sources:
+        shutil.copy(file, directory / file.name)
+
+    for index in range(count - len(sources)):
+        source = sources[index % len(sources)]
+        shutil.copy(source, directory / f"{source.stem}_copy{index:04}.py")
+
+
+def run(count: int, repeats: int) -> dict:
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        fill_directory(pathlib.Path(directory), count)
+
+        for _ in range(repeats):
+            output = subprocess.run(
+                [sys.executable, __file__, "--child", directory], capture_output=True, text=True, check=True
+            ).stdout
+            results.append(json.loads(output.splitlines()[-1]))
+
+    # The fastest run is the least disturbed by the rest of the machine
+    return min(results, key=lambda result: result["window"])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--counts", type=int, nargs="+", default=[4, 25, 100], help="numbers of simulations")
+    parser.add_argument("--repeats", type=int, default=3, help="runs per count, the fastest is reported")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child is not None:
+        print(json.dumps(measure(args.child)))
+        return 0
+
+    sys.path.insert(0, str(ROOT))
+    results = [run(count, args.repeats) for count in args.counts]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'simulations':>11} {'window (s)':>10} {'first simulation (s)':>20}  loaded at window")
+        for result in results:
+            loaded = ", ".join(module for module, loaded in result["loaded_at_window"].items() if loaded) or "-"
+            print(
+                f"{result['simulations']:>11} {result['window']:>10.3f} {result['first_simulation']:>20.3f}  {loaded}"
+            )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
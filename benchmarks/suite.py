@@ -0,0 +1,248 @@
+"""Performance benchmarks of the simulations and the GUI, saved as JSON so versions can be compared
+
+Covers simulate() throughput and memory for every simulation module, the time to build each figure and draw a frame of
+its animation, the latency from MainWindow.update_simulation() to the new canvas, and the startup time. It runs without
+a display through the offscreen Qt platform:
+
+    python benchmarks/suite.py --out before.json
+    python benchmarks/suite.py --out after.json --compare before.json
+
+Every metric is the best of --repeats runs. Metrics ending in _per_second are better when higher, all others (seconds
+and bytes) are better when lower.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import pathlib
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+FRAMES = 500  # animation frames drawn per figure
+BENCHMARKS = ["simulate", "figure", "gui", "startup"]
+
+
+def best_time(function, repeats: int) -> float:
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def load_simulations() -> dict:
+    from simulations import registry
+
+    return {
+        metadata["module"]: importlib.import_module(f"simulations.{metadata['module']}")
+        for metadata in registry.get_simulations(ROOT / "simulations")
+    }
+
+
+def bench_simulate(modules: dict, repeats: int) -> dict:
+    # run() rather than simulate(), so the cache doesn't hide the cost of simulating
+    results = {}
+    for name, module in modules.items():
+        results[name] = {}
+
+        for path, analytic in (("default", True), ("numeric", False)):
+            simulation = module.Simulation()
+            simulation.ANALYTIC = analytic
+
+            seconds = best_time(lambda simulation=simulation: simulation.run(simulation.initial_conditions()), repeats)
+            states = simulation.run(simulation.initial_conditions())
+
+            tracemalloc.start()
+            simulation.run(simulation.initial_conditions())
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            results[name][path] = {
+                "steps": len(states) - 1,
+                "seconds": seconds,
+                "steps_per_second": (len(states) - 1) / seconds,
+                "trajectory_bytes": states.nbytes,
+                "peak_bytes": peak,
+            }
+
+    return results
+
+
+def bench_figure(modules: dict, repeats: int) -> dict:
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    results = {}
+    for name, module in modules.items():
+        simulation = module.Simulation()
+        simulation.simulate(simulation.initial_conditions())  # cached, so only the figure is timed
+
+        def build(simulation=simulation):
+            plt.close("all")
+            return simulation.get_figure()
+
+        build_seconds = best_time(build, repeats)
+
+        fig, anim = build()
+        fig.canvas.draw()
+        frames = min(FRAMES, len(simulation.state))
+
+        # Drawn by calling what the animation's timer would, which blits the artists the frame function returns. The
+        # first draw above started the animation, which added its callback to the timer
+        def draw_frames(anim=anim, frames=frames):
+            for _ in range(frames):
+                for callback, args, kwargs in anim.event_source.callbacks:
+                    callback(*args, **kwargs)
+
+        frame_seconds = best_time(draw_frames, repeats) / frames
+        plt.close("all")
+
+        results[name] = {"build_seconds": build_seconds, "frame_seconds": frame_seconds, "frames": frames}
+
+    return results
+
+
+def bench_gui(repeats: int) -> dict:
+    from PySide6.QtWidgets import QApplication
+
+    app = QApplication.instance() or QApplication([])
+
+    import main
+    from gui import main_window
+    from gui.worker import DEBOUNCE_MS
+
+    window = main_window.MainWindow(main.get_icon_file(), main.get_simulations())
+    app.processEvents()
+
+    results = {}
+    for button in window.buttons:
+        button.click()
+        app.processEvents()
+
+        # A float field is moved a little further each time, an offset rather than a factor so fields at zero move
+        # too, so every update has to be simulated
+        fields = button.simulation.get_fields()
+        field = next(field for field, data in fields.items() if data["type"] == "float")
+        value = fields[field]["value"]
+
+        # Timed until the finished run's canvas has been swapped in, a preview of a long run shows one before that
+        finished = button.runner.finished
+        updated = []
+
+        def finish_update(variables, finished=finished, updated=updated):
+            finished(variables)
+            updated.append(variables)
+
+        button.runner.finished = finish_update
+
+        latencies = []
+        for repeat in range(repeats):
+            updated.clear()
+            start = time.perf_counter()
+            window.update_simulation({field: value + 1e-3 * (repeat + 1)})
+            while not updated:
+                app.processEvents()
+                time.sleep(0.001)
+            latencies.append(time.perf_counter() - start)
+
+        button.runner.finished = finished
+        results[button.metadata["module"]] = {
+            "update_seconds": min(latencies),
+            "update_without_debounce_seconds": min(latencies) - DEBOUNCE_MS / 1000,
+        }
+
+    window.close()
+    return results
+
+
+def bench_startup(repeats: int) -> dict:
+    command = [sys.executable, str(ROOT / "benchmarks" / "startup.py"), "--json", "--counts", "4"]
+    output = subprocess.run(command + ["--repeats", str(repeats)], capture_output=True, text=True, check=True).stdout
+    result = json.loads(output)[0]
+    return {"window_seconds": result["window"], "first_simulation_seconds": result["first_simulation"]}
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    metrics = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            metrics.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[f"{prefix}{key}"] = value
+    return metrics
+
+
+def compare(old: dict, new: dict, threshold: float) -> list:
+    # Returns the regressed metrics after printing every metric both runs have
+    old_metrics, new_metrics = flatten(old["results"]), flatten(new["results"])
+    regressions = []
+
+    print(f"{'metric':<60} {'old':>12} {'new':>12} {'change':>8}")
+    for metric in sorted(old_metrics.keys() & new_metrics.keys()):
+        if metric.endswith((".steps", ".frames")):
+            continue
+
+        before, after = old_metrics[metric], new_metrics[metric]
+        change = (after - before) / before if before else 0.0
+        worse = -change if metric.endswith("_per_second") else change
+
+        flag = ""
+        if worse > threshold:
+            regressions.append(metric)
+            flag = "  regression"
+        print(f"{metric:<60} {before:>12.4g} {after:>12.4g} {change:>+8.1%}{flag}")
+
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--out", type=pathlib.Path, help="file to write the results to as JSON")
+    parser.add_argument("--compare", type=pathlib.Path, help="results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change counted as a regression")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS, help="benchmarks to run")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    sys.path.insert(0, str(ROOT))
+    modules = load_simulations()
+
+    results = {}
+    if "simulate" in args.only:
+        results["simulate"] = bench_simulate(modules, args.repeats)
+    if "figure" in args.only:
+        results["figure"] = bench_figure(modules, args.repeats)
+    if "gui" in args.only:
+        results["gui"] = bench_gui(args.repeats)
+    if "startup" in args.only:
+        results["startup"] = bench_startup(args.repeats)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+    if args.out is not None:
+        args.out.write_text(json.dumps(report, indent=2))
+
+    if args.compare is not None:
+        regressions = compare(json.loads(args.compare.read_text()), report, args.threshold)
+        return 1 if regressions else 0
+
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
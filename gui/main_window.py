@@ -9,34 +9,49 @@ from PySide6.QtWidgets import (
     QCheckBox,
 )
 from PySide6.QtCore import Qt, QTimer
-from PySide6.QtGui import QIntValidator, QDoubleValidator
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-import matplotlib
+from PySide6.QtGui import QIntValidator, QDoubleValidator, QKeySequence, QShortcut
+from functools import cache
+from math import inf
 import importlib
 from gui.base import BaseWindow
+from gui.overlay import PerformanceOverlay
+from simulations.instrumentation import profiler
 from pathlib import Path
 
-import matplotlib.pyplot as plt
+LINK = "https://github.com/TheBobTheBlob/Physical-Mechanics-Simulations"
 
-matplotlib.use("QtAgg")
-plt.style.use("dark_background")  # Dark theme
-# BUG: Still dark if user theme is light
 
-LINK = "https://github.com/TheBobTheBlob/Physical-Mechanics-Simulations"
+@cache
+def setup_matplotlib() -> None:
+    # Run when the first simulation is shown rather than on import, as matplotlib is slow to load
+    import matplotlib
+    import matplotlib.pyplot as plt
+
+    matplotlib.use("QtAgg")
+    plt.style.use("dark_background")  # Dark theme
+    # BUG: Still dark if user theme is light
+
+
+def reading_text(label: str, value, unit: str) -> str:
+    return f"{label}: {value} {unit}" if unit else f"{label}: {value}"
 
 
 class SimulationButton(QPushButton):
-    def __init__(self, text, action, update_simulation, first=False):
-        module = importlib.import_module(f"simulations.{text}")
-        self.simulation = module.Simulation()
+    def __init__(self, metadata, action, update_simulation, simulation_updated):
+        # Only the metadata from the registry is known until the button is first clicked, see load()
+        self.metadata = metadata
+        self.simulation = None
+        self.runner = None
 
-        super().__init__(self.simulation.name)
+        super().__init__(metadata["name"])
         self.clicked.connect(self.click)
+        self.setToolTip(metadata["description"])
 
         self.setStyleSheet("padding: 10px;")
 
         self.action = action
         self.update_simulation = update_simulation
+        self.simulation_updated = simulation_updated
 
         self.figure = None
         self.anim = None
@@ -48,18 +63,41 @@ class SimulationButton(QPushButton):
 
         self.readings_widget = None
         self.readings_layout = None
+        self.reading_labels = []
+        self.reading_values = []  # values currently shown by reading_labels
+
+    def load(self) -> None:
+        # The worker imports the simulation package, which brings in numpy
+        from gui.worker import SimulationRunner
+
+        module = importlib.import_module(f"simulations.{self.metadata['module']}")
+        self.simulation = module.Simulation()
+
+        # Changed fields are simulated in the background, see finish_update()
+        self.runner = SimulationRunner(self.simulation, self.finish_update, self.show_preview)
 
-        self.refresh_canvas(run=first)
         self.edit_fields()
         self.readings()
 
-    def refresh_canvas(self, run=True) -> None:
-        if run:
+        # Readings follow the animation rather than a timer
+        self.simulation.frame_callback = self.update_readings
+
+    def refresh_canvas(self) -> None:
+        with profiler.span("refresh_canvas", simulation=self.simulation.name):
+            setup_matplotlib()
+
+            import matplotlib.pyplot as plt
+            from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+
             plt.close("all")
-            self.figure, self.anim = self.simulation.get_figure()
+            with profiler.span("get_figure", simulation=self.simulation.name):
+                self.figure, self.anim = self.simulation.get_figure()
             self.canvas = FigureCanvas(self.figure)
 
     def click(self) -> None:
+        if self.simulation is None:
+            self.load()
+
         self.refresh_canvas()
         self.action(self.position)
 
@@ -75,6 +113,21 @@ class SimulationButton(QPushButton):
         else:
             return False
 
+    def show_preview(self, variables, states) -> None:
+        # Plays the start of a run that is still being simulated, until finish_update() replaces it
+        self.simulation.preview = states
+        self.simulation_updated(self, self.update_variables(variables))
+
+    def finish_update(self, variables) -> None:
+        # The runner has already simulated these variables, so get_figure() finds the run in the cache. A preview that
+        # was playing is continued from the same frame
+        if self.simulation.preview is not None:
+            self.simulation.preview = None
+            self.simulation.start_frame = self.simulation.frame
+
+        self.simulation_updated(self, self.update_variables(variables))
+        self.simulation.start_frame = 0
+
     def edit_fields(self) -> None:
         fields = {}
         labels = {}
@@ -154,8 +207,8 @@ class SimulationButton(QPushButton):
                 def connect(field):
                     def inner():
                         if (
-                            fields[field].text() not in ["", "."]
-                            and float(fields[field].text()) >= self.simulation.get_fields()[field]["min"]
+                            fields[field].text() not in ["", ".", "-", "-."]
+                            and float(fields[field].text()) >= self.simulation.get_fields()[field].get("min", -inf)
                         ):
                             self.update_simulation({field: float(fields[field].text())})
 
@@ -197,11 +250,38 @@ class SimulationButton(QPushButton):
         self.readings_widget.setLayout(self.readings_layout)
 
         for value in self.simulation.get_readings().values():
-            self.readings_layout.addWidget(QLabel(f"{value["label"]}: {value["value"]}"))
+            self.reading_labels.append(QLabel(reading_text(value["label"], value["value"], value["unit"])))
+            self.reading_values.append(value["value"])
+            self.readings_layout.addWidget(self.reading_labels[-1])
+
+    def rebuild_readings(self, count) -> None:
+        # Simulations whose size is a parameter can change how many readings they have
+        for label in self.reading_labels:
+            self.readings_layout.removeWidget(label)
+            label.deleteLater()
+
+        self.reading_labels = [QLabel() for _ in range(count)]
+        self.reading_values = [None] * count  # none shown yet, so every label is set by update_readings()
+        for label in self.reading_labels:
+            self.readings_layout.addWidget(label)
+
+    def update_readings(self, index) -> None:
+        # index is the recorded state the animation is showing
+        with profiler.span("update_readings"):
+            _, labels, units, values = self.simulation.readings_table()
+            row = values[min(index, len(values) - 1)].tolist()
 
-    def update_readings(self) -> None:
-        for index, value in enumerate(self.simulation.get_readings().values()):
-            self.readings_layout.itemAt(index).widget().setText(f"{value["label"]}: {value["value"]}")
+            if len(row) != len(self.reading_labels):
+                self.rebuild_readings(len(row))
+
+            # Most frames only change some of the readings, and a paused or finished animation none of them
+            if row == self.reading_values:
+                return
+
+            for position, (label, unit, value) in enumerate(zip(labels, units, row)):
+                if value != self.reading_values[position]:
+                    self.reading_labels[position].setText(reading_text(label, value, unit))
+            self.reading_values = row
 
 
 class Heading(QLabel):
@@ -214,6 +294,7 @@ class Heading(QLabel):
 
 class MainWindow(BaseWindow):
     def __init__(self, icon: Path, simulations: list):
+        # simulations is the metadata of each simulation from the registry
         super().__init__(icon)
         self.showMaximized()
 
@@ -237,11 +318,12 @@ class MainWindow(BaseWindow):
         self.sidebar.addLayout(self.settings_list)
         self.sidebar.addLayout(self.readings_list)
         self.sidebar_widget.setLayout(self.sidebar)
-        self.sidebar_widget.setMaximumWidth(300)
+        # Fixed, so readings changing length every frame can't resize the canvas, which restarts its animation
+        self.sidebar_widget.setFixedWidth(300)
 
         self.graph_layout = QVBoxLayout()
         self.buttons = []
-        self.graph_index = 0
+        self.graph_index = None  # nothing is shown until the first simulation has loaded
 
         # Main layout
 
@@ -252,31 +334,32 @@ class MainWindow(BaseWindow):
         # Add simulation buttons
 
         self.readings_list.addWidget(Heading("Readings"))
+        self.readings_list.addStretch()
 
-        self.readings_timer = QTimer()
-        self.readings_timer.timeout.connect(self.update_readings)
-        self.readings_timer.start(10)
+        # Performance overlay, shown from the start when profiling is enabled through the environment
+        self.overlay = PerformanceOverlay()
+        self.sidebar.addWidget(self.overlay)
 
-        for index, file in enumerate(simulations):
-            button = SimulationButton(file.stem, self.change_figure, self.update_simulation, first=index == 0)
-            self.buttons.append(button)
+        self.overlay_timer = QTimer()
+        self.overlay_timer.timeout.connect(self.update_overlay)
 
-            buttons_list.addWidget(button)
+        QShortcut(QKeySequence("F3"), self).activated.connect(self.toggle_overlay)
+        self.profiling_from_environment = profiler.enabled
+        if profiler.enabled:
+            self.toggle_overlay()
 
-            if index == 0:
-                self.graph_layout.addWidget(button.canvas)
-                self.graph_index = index
-
-                self.settings_list.addWidget(button.fields_widget)
-                self.readings_list.addWidget(button.readings_widget)
-                self.readings_list.addStretch()
-
-                button.setEnabled(False)
+        for index, metadata in enumerate(simulations):
+            button = SimulationButton(metadata, self.change_figure, self.update_simulation, self.simulation_updated)
+            self.buttons.append(button)
 
+            buttons_list.addWidget(button)
             button.set_position(index)
 
         buttons_list.addStretch()
 
+        # The first simulation is loaded once the event loop runs, so the window appears before it is simulated
+        QTimer.singleShot(0, self.buttons[0].click)
+
         # Add link to GitHub
         link = QLabel(f'<a href="{LINK}">Created by Punit Turlapati</a>')
         link.setOpenExternalLinks(True)
@@ -289,14 +372,15 @@ class MainWindow(BaseWindow):
         self.setCentralWidget(widget)
 
     def change_figure(self, position):
-        self.buttons[self.graph_index].setEnabled(True)
-        self.graph_layout.removeWidget(self.buttons[self.graph_index].canvas)
+        if self.graph_index is not None:
+            self.buttons[self.graph_index].setEnabled(True)
+            self.graph_layout.removeWidget(self.buttons[self.graph_index].canvas)
 
-        self.settings_list.removeWidget(self.buttons[self.graph_index].fields_widget)
-        self.buttons[self.graph_index].fields_widget.setParent(None)
+            self.settings_list.removeWidget(self.buttons[self.graph_index].fields_widget)
+            self.buttons[self.graph_index].fields_widget.setParent(None)
 
-        self.readings_list.removeWidget(self.buttons[self.graph_index].readings_widget)
-        self.buttons[self.graph_index].readings_widget.setParent(None)
+            self.readings_list.removeWidget(self.buttons[self.graph_index].readings_widget)
+            self.buttons[self.graph_index].readings_widget.setParent(None)
 
         self.graph_index = position
 
@@ -307,11 +391,27 @@ class MainWindow(BaseWindow):
         self.readings_list.insertWidget(1, self.buttons[self.graph_index].readings_widget)
 
     def update_simulation(self, variables):
-        success = self.buttons[self.graph_index].update_variables(variables)
+        # Runs in the background, the new canvas is shown by simulation_updated()
+        self.buttons[self.graph_index].runner.request(variables)
 
-        if success:
+    def simulation_updated(self, button, success):
+        # The user may have switched to another simulation while this one was running
+        if success and button is self.buttons[self.graph_index]:
             self.graph_layout.removeItem(self.graph_layout.itemAt(self.graph_layout.count() - 1))
             self.graph_layout.addWidget(self.buttons[self.graph_index].canvas)
 
-    def update_readings(self):
-        self.buttons[self.graph_index].update_readings()
+    def toggle_overlay(self):
+        # Profiling only runs while the overlay is shown, unless the environment turned it on
+        if self.overlay.isVisible():
+            self.overlay_timer.stop()
+            self.overlay.hide()
+            profiler.enabled = self.profiling_from_environment
+        else:
+            profiler.enabled = True
+            self.update_overlay()
+            self.overlay.show()
+            self.overlay_timer.start(500)
+
+    def update_overlay(self):
+        simulation = None if self.graph_index is None else self.buttons[self.graph_index].simulation
+        self.overlay.refresh(simulation)
@@ -0,0 +1,64 @@
+import sys
+
+from PySide6.QtWidgets import QLabel
+
+from simulations.instrumentation import profiler
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def memory_text(simulation) -> str:
+    parts = []
+    if simulation is not None:
+        parts.append(f"cache {simulation.cache.size / 1024**2:.1f} MB")
+
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak *= 1 if sys.platform == "darwin" else 1024  # bytes on macOS, kilobytes elsewhere
+        parts.append(f"peak {peak / 1024**2:.0f} MB")
+
+    return ", ".join(parts) or "unknown"
+
+
+class PerformanceOverlay(QLabel):
+    """Rates over the last refresh and totals from the profiler, toggled with F3"""
+
+    def __init__(self):
+        super().__init__()
+        self.setStyleSheet("font-family: monospace; font-size: 11px; padding: 6px; background: rgba(0, 0, 0, 120);")
+        self.previous = None
+        self.hide()
+
+    def refresh(self, simulation) -> None:
+        snapshot = profiler.snapshot()
+        previous = self.previous or {"time": 0.0, "counters": {}, "histograms": {}}
+        self.previous = snapshot
+
+        elapsed = max(snapshot["time"] - previous["time"], 1e-9)
+
+        def rate(counter):
+            return (snapshot["counters"].get(counter, 0) - previous["counters"].get(counter, 0)) / elapsed
+
+        def recent_mean(name):
+            now = snapshot["histograms"].get(name, {"count": 0, "total": 0.0})
+            before = previous["histograms"].get(name, {"count": 0, "total": 0.0})
+            count = now["count"] - before["count"]
+            return (now["total"] - before["total"]) / count * 1000 if count else 0.0
+
+        def p95(name):
+            return snapshot["histograms"].get(name, {"p95": 0.0})["p95"] * 1000
+
+        lines = [
+            f"steps/s      {rate('steps'):,.0f}",
+            f"frames/s     {rate('frames'):.1f}",
+            f"frame        {recent_mean('frame'):.2f} ms (p95 {p95('frame'):.2f} ms)",
+            f"dropped      {rate('dropped_frames'):.1f}/s, {snapshot['counters'].get('dropped_frames', 0)} total",
+            f"simulate     {recent_mean('simulate'):.1f} ms (p95 {p95('simulate'):.1f} ms)",
+            f"get_figure   {recent_mean('get_figure'):.1f} ms (p95 {p95('get_figure'):.1f} ms)",
+            f"readings     {recent_mean('update_readings'):.2f} ms (p95 {p95('update_readings'):.2f} ms)",
+            f"memory       {memory_text(simulation)}",
+        ]
+        self.setText("\n".join(lines))
@@ -0,0 +1,112 @@
+from time import perf_counter
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, QTimer, Signal
+
+from simulations.simulation import SimulationCancelled
+
+DEBOUNCE_MS = 200  # Changes closer together than this are simulated once, e.g. typing a number
+PREVIEW_AFTER = 0.3  # seconds a run may take before the part simulated so far is played
+PREVIEW_CHUNK = 256  # most states simulated between checks for a preview, about 10 seconds of playback
+
+
+class JobSignals(QObject):
+    finished = Signal(int, dict, bool)  # generation, variables, whether the run completed
+    preview = Signal(int, dict, object)  # generation, variables, states simulated so far
+
+
+class SimulationJob(QRunnable):
+    def __init__(self, simulation, generation, variables):
+        super().__init__()
+        self.simulation = simulation
+        self.generation = generation
+        self.variables = variables
+        self.signals = JobSignals()
+
+        # Kept alive by the runner until finished arrives, so the pool must not delete it
+        self.setAutoDelete(False)
+
+    def run(self) -> None:
+        completed = False
+        try:
+            self.simulate()
+            completed = True
+        except SimulationCancelled:
+            pass
+        finally:
+            self.signals.finished.emit(self.generation, self.variables, completed)
+
+    def simulate(self) -> None:
+        start = perf_counter()
+        previewed = False
+        previous_length = 0
+
+        # Slow runs yield every PREVIEW_AFTER too, so the first of their states is played soon after it
+        initial_state = self.simulation.initial_conditions()
+        for states in self.simulation.simulate_progressively(initial_state, None, PREVIEW_CHUNK, PREVIEW_AFTER):
+            # The run isn't over until the generator is, so the states seen one step before are known to be partial
+            if not previewed and 0 < previous_length < len(states) and perf_counter() - start > PREVIEW_AFTER:
+                self.signals.preview.emit(self.generation, self.variables, states[:previous_length].copy())
+                previewed = True
+            previous_length = len(states)
+
+
+class SimulationRunner(QObject):
+    """Simulates changed variables on a worker thread, then hands them to finished on the main thread
+
+    The run happens on a copy of the simulation so the one being shown is untouched until the result is ready. Its
+    trajectory ends up in the cache, so the simulate() of the following get_figure() is only a lookup. Each change
+    cancels the run in progress, and only the run of the newest change is handed on.
+    """
+
+    def __init__(self, simulation, finished, previewed):
+        super().__init__()
+        self.simulation = simulation
+        self.finished = finished
+        self.previewed = previewed
+
+        self.pending = {}
+        self.generation = 0
+        self.jobs = {}  # generation: job, for every run that has not finished yet
+
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(DEBOUNCE_MS)
+        self.timer.timeout.connect(self.start)
+
+    def request(self, variables) -> None:
+        self.pending.update(variables)
+        self.cancel()
+        self.timer.start()
+
+    def cancel(self) -> None:
+        self.generation += 1
+        for job in self.jobs.values():
+            job.simulation.cancel_requested = True
+
+    def start(self) -> None:
+        clone = self.simulation.clone()
+        variables = dict(self.pending)
+
+        if not clone.update_variables(variables):
+            return
+
+        job = SimulationJob(clone, self.generation, variables)
+        job.signals.finished.connect(self.job_finished)
+        job.signals.preview.connect(self.job_previewed)
+        self.jobs[self.generation] = job
+        QThreadPool.globalInstance().start(job)
+
+    def job_previewed(self, generation, variables, states) -> None:
+        if generation == self.generation:
+            self.previewed(variables, states)
+
+    def job_finished(self, generation, variables, completed) -> None:
+        self.jobs.pop(generation, None)
+        if not completed or generation != self.generation:
+            return
+
+        for field, value in variables.items():
+            if self.pending.get(field) == value:
+                del self.pending[field]
+
+        self.finished(variables)
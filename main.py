@@ -3,17 +3,18 @@ from PySide6.QtWidgets import QApplication
 import sys
 import pathlib
 import gui.no_simulations as no_simulations
+from simulations import registry
 
 
-def get_simulation_files():
+def get_simulations():
     if getattr(sys, "frozen", False):  # If running in a PyInstaller bundle
         base_path = pathlib.Path(sys._MEIPASS)  # Temp directory where PyInstaller unpacks
     else:
         base_path = pathlib.Path(__file__).parent
-    files = pathlib.Path(base_path / "simulations").rglob("*.py")
 
-    # simulation.py contains the base class for all simulations so we don't want to include it in the list of simulations
-    return [file for file in files if file.stem != "simulation"]
+    # Only modules defining a Simulation class are listed, which leaves out the base class and support modules. Their
+    # metadata is read from the source, the modules themselves are imported when first shown
+    return registry.get_simulations(base_path / "simulations")
 
 
 def get_icon_file():
@@ -25,7 +26,7 @@ def get_icon_file():
 
 
 if __name__ == "__main__":
-    simulations = get_simulation_files()
+    simulations = get_simulations()
     app = QApplication(sys.argv)
 
     if len(simulations) == 0:
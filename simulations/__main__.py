@@ -0,0 +1,266 @@
+"""Headless command line runner for the simulations
+
+    python -m simulations list
+    python -m simulations run object_off_slope --param launch_angle=60 --param air_resistance=true --out run.npz
+    python -m simulations cross-section --samples 10000000 --param r1=2 --out cross_section.csv
+    python -m simulations diagnostics damped_oscillator --rate 100 --plot drift.png
+
+Only NumPy and the physics are imported, neither Qt nor matplotlib are loaded unless a plot is asked for.
+"""
+
+import argparse
+import importlib
+import json
+import pathlib
+import sys
+
+import numpy as np
+
+from . import cross_section, diagnostics, registry, storage, trajectory_file, writers
+
+DIRECTORY = pathlib.Path(__file__).parent
+
+
+def load_simulation(name: str):
+    names = [file.stem for file in registry.get_simulation_files(DIRECTORY)]
+    if name not in names:
+        raise SystemExit(f"Unknown simulation {name!r}, expected one of {', '.join(names)}")
+
+    return importlib.import_module(f"{__package__}.{name}").Simulation()
+
+
+def parse_value(field: dict, text: str):
+    if field["type"] in ("slider", "integer"):
+        return int(text)
+    if field["type"] == "checkbox":
+        if text.lower() not in ("true", "false", "1", "0", "yes", "no", "on", "off"):
+            raise ValueError(f"expected true or false, got {text!r}")
+        return text.lower() in ("true", "1", "yes", "on")
+    return float(text)
+
+
+def parse_parameters(simulation, parameters: list) -> dict:
+    fields = simulation.get_fields()
+    variables = {}
+
+    for parameter in parameters:
+        name, _, text = parameter.partition("=")
+        if name not in fields:
+            raise SystemExit(f"{simulation.name} has no parameter {name!r}, expected one of {', '.join(fields)}")
+
+        try:
+            variables[name] = parse_value(fields[name], text)
+        except ValueError as error:
+            raise SystemExit(f"Invalid value for {name}: {error}")
+
+    return variables
+
+
+def write_trajectory(simulation, states, out: pathlib.Path, integrator=None) -> None:
+    if out.suffix == ".csv":
+        np.savetxt(out, states, delimiter=",", header=writers.csv_header(simulation))
+    elif out.suffix == ".traj":
+        with writers.open_writer(out, simulation, integrator) as writer:
+            writer.write(states)
+    elif out.suffix == ".npz":
+        fields = {name: field["value"] for name, field in simulation.get_fields().items()}
+        np.savez(
+            out,
+            states=states,
+            times=simulation.state_times(),
+            schema=json.dumps(simulation.schema()),
+            parameters=json.dumps(fields),
+            events=json.dumps([{**event, "state": event["state"].tolist()} for event in simulation.events]),
+        )
+    else:
+        np.save(out, states)
+
+
+def run(args) -> int:
+    simulation = load_simulation(args.name)
+
+    simulation.update_variables(parse_parameters(simulation, args.param))
+    if args.rate is not None:
+        simulation.SIMS_PER_SECOND = args.rate
+    if args.storage is not None:
+        simulation.STORAGE = args.storage
+    if args.cache is not None:
+        simulation.cache.directory = args.cache
+    if args.tolerance is not None:
+        if args.rate is not None:
+            raise SystemExit("--tolerance chooses the rate, it can't be used with --rate")
+        rate, drift = diagnostics.select_rate(simulation, args.tolerance, args.integrator)
+        worst = diagnostics.worst_drift(drift)
+        print(f"{simulation.name}: {rate} steps per second, largest drift {worst:.3g}")
+        if worst > args.tolerance:
+            print(f"No rate keeps the drift within {args.tolerance:g}, it doesn't come from the step size")
+
+    if args.stream or args.resume:
+        return stream(simulation, args)
+
+    states = simulation.simulate(simulation.initial_conditions(), args.integrator)
+
+    if args.out is not None:
+        write_trajectory(simulation, states, args.out, args.integrator)
+    else:
+        print(f"{simulation.name}: {len(states)} states over {simulation.state_times()[-1]} s")
+        print(f"Final state: {states[-1].tolist()}")
+        for event in simulation.events:
+            print(f"{event['name']} at {event['time']} s: {event['state'].tolist()}")
+
+    return 0
+
+
+def stream(simulation, args) -> int:
+    # Writes each block as it is simulated, so only one block is ever in memory
+    if args.out is None:
+        raise SystemExit("--stream needs --out")
+
+    # .traj files are checkpointed as they are written, so an interrupted run can be resumed
+    if args.out.suffix == ".traj":
+        recording = trajectory_file.record(simulation, args.out, args.integrator, resume=args.resume)
+        print(f"{simulation.name}: {len(recording)} states written to {args.out}")
+        return 0
+    if args.resume:
+        raise SystemExit("--resume needs --out to be a .traj file")
+
+    try:
+        writer = writers.open_writer(args.out, simulation, args.integrator)
+    except ValueError as error:
+        raise SystemExit(str(error))
+
+    with writer:
+        for chunk in simulation.stream(simulation.initial_conditions(), args.integrator):
+            writer.write(chunk)
+
+    print(f"{simulation.name}: {writer.rows} states written to {args.out}")
+    return 0
+
+
+def differential_cross_section(args) -> int:
+    simulation = load_simulation("scattering")
+    simulation.update_variables(parse_parameters(simulation, args.param))
+
+    result = cross_section.differential_cross_section(
+        simulation, args.samples, args.bins, dimensions=args.dimensions, seed=args.seed
+    )
+    unit = "m^2/sr" if args.dimensions == 3 else "m/rad"
+    angles = np.rad2deg(result["edges"])
+    table = np.column_stack([angles[:-1], angles[1:], result["counts"], result["cross_section"], result["error"]])
+
+    if args.out is not None:
+        header = f"angle_from [deg],angle_to [deg],count,cross_section [{unit}],error [{unit}]"
+        np.savetxt(args.out, table, delimiter=",", header=header)
+    else:
+        for low, high, count, value, error in table[result["counts"] > 0]:
+            print(f"{low:6.1f} to {high:6.1f} deg: {value:.6g} ± {error:.2g} {unit}")
+
+    print(f"Total: {result['total']:.6g} ± {result['total_error']:.2g} {unit.split('/')[0]}")
+    return 0
+
+
+def show_diagnostics(args) -> int:
+    simulation = load_simulation(args.name)
+    simulation.update_variables(parse_parameters(simulation, args.param))
+    if args.rate is not None:
+        simulation.SIMS_PER_SECOND = args.rate
+
+    states = simulation.run(simulation.initial_conditions(), args.integrator)
+    times = simulation.state_times()
+
+    rate = simulation.SIMS_PER_SECOND
+    print(f"{simulation.name}: {len(states)} states over {times[-1]} s at {rate} steps per second")
+    drift = simulation.drift(states, times)
+    for key, invariant in simulation.invariants(states, times).items():
+        values, unit = invariant["values"], invariant["unit"]
+        line = f"{invariant['label']}: {values[0]:.6g} to {values[-1]:.6g} {unit}"
+        print(f"{line}, drift {drift[key]:.3g}" if key in drift else line)
+
+    if args.plot is not None:
+        import matplotlib
+
+        matplotlib.use("Agg")
+        diagnostics.drift_figure(simulation, states, times).savefig(args.plot)
+
+    return 0
+
+
+def list_simulations(args) -> int:
+    for file in registry.get_simulation_files(DIRECTORY):
+        print(file.stem)
+
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m simulations", description="Run simulations without the GUI")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="list the available simulations").set_defaults(function=list_simulations)
+
+    run_parser = commands.add_parser("run", help="run a simulation and write its trajectory")
+    run_parser.add_argument("name", help="simulation module name, as printed by list")
+    run_parser.add_argument(
+        "--param", action="append", default=[], metavar="FIELD=VALUE", help="set a parameter, may be repeated"
+    )
+    run_parser.add_argument("--integrator", help="integrator to use instead of the simulation's default")
+    run_parser.add_argument("--rate", type=int, help="steps per second, SIMS_PER_SECOND")
+    run_parser.add_argument(
+        "--out", type=pathlib.Path, help="file to write the states to, .npy, .npz or .traj with metadata, or .csv"
+    )
+    run_parser.add_argument(
+        "--storage",
+        choices=storage.STORAGES,
+        help="how the states are kept and written, float32 and quantized take half the memory or less",
+    )
+    run_parser.add_argument(
+        "--cache", type=pathlib.Path, metavar="DIRECTORY", help="keep results on disk so repeated runs are instant"
+    )
+    run_parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="write the states to --out (.npy, .csv or .traj) as they are simulated instead of keeping them in memory",
+    )
+    run_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue an interrupted --stream to a .traj file from its last checkpoint, or keep it if it's complete",
+    )
+    run_parser.add_argument(
+        "--tolerance",
+        type=float,
+        help="run at the coarsest rate that keeps the conserved quantities within this relative drift",
+    )
+    run_parser.set_defaults(function=run)
+
+    diagnostics_parser = commands.add_parser(
+        "diagnostics", help="conserved and dissipated quantities of a run and how far they drift"
+    )
+    diagnostics_parser.add_argument("name", help="simulation module name, as printed by list")
+    diagnostics_parser.add_argument(
+        "--param", action="append", default=[], metavar="FIELD=VALUE", help="set a parameter, may be repeated"
+    )
+    diagnostics_parser.add_argument("--integrator", help="integrator to use instead of the simulation's default")
+    diagnostics_parser.add_argument("--rate", type=int, help="steps per second, SIMS_PER_SECOND")
+    diagnostics_parser.add_argument("--plot", type=pathlib.Path, help="image file to plot the drift over time to")
+    diagnostics_parser.set_defaults(function=show_diagnostics)
+
+    cross_section_parser = commands.add_parser(
+        "cross-section", help="differential cross section of the scattering simulation from sampled impact parameters"
+    )
+    cross_section_parser.add_argument(
+        "--param", action="append", default=[], metavar="FIELD=VALUE", help="set a parameter, may be repeated"
+    )
+    cross_section_parser.add_argument("--samples", type=int, default=10**6, help="number of impact parameters")
+    cross_section_parser.add_argument("--bins", type=int, default=90, help="angle bins between 0 and 180 degrees")
+    cross_section_parser.add_argument("--dimensions", type=int, choices=[2, 3], default=3)
+    cross_section_parser.add_argument("--seed", type=int)
+    cross_section_parser.add_argument("--out", type=pathlib.Path, help=".csv file to write the histogram to")
+    cross_section_parser.set_defaults(function=differential_cross_section)
+
+    args = parser.parse_args(argv)
+    return args.function(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""Least recently used cache of simulation results keyed on their parameters"""
+
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .checkpoint import from_json, to_json
+from .storage import QuantizedStates
+
+
+def canonical(value):
+    # Equal parameters must give equal keys whatever their type, e.g. 45 from a slider and 45.0 from a text field
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    if isinstance(value, np.ndarray):
+        return [canonical(item) for item in value.tolist()]
+    if isinstance(value, (list, tuple)):
+        return [canonical(item) for item in value]
+    return str(value)
+
+
+class TrajectoryCache:
+    """States, events and final checkpoint of simulation runs, kept in memory up to max_bytes and optionally on disk
+
+    States are arrays or the QuantizedStates of runs with compact storage, see storage.py.
+
+    The memory tier evicts the least recently used runs once their states take more than max_bytes. When a directory
+    is set, every run is also written there, so other processes and later sessions with the same configuration find
+    it too, and the least recently used files are removed once they take more than max_disk_bytes.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024**2, directory=None, max_disk_bytes: int = 4 * 1024**3):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.directory = None if directory is None else pathlib.Path(directory)
+
+        self.entries: OrderedDict = OrderedDict()
+        self.related: dict = {}  # key ignoring late acting parameters -> key of the latest such run, see reuse_prefix()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+        # The GUI simulates on worker threads while the main thread reads the cache
+        self.lock = threading.RLock()
+
+    def key(self, simulation, initial_state, integrator=None, ignore=()) -> str:
+        # Every uppercase attribute is a parameter of the run, which covers the values of get_fields(), G_EARTH,
+        # SIMS_PER_SECOND and INTEGRATOR, apart from the ones only get_figure() uses and any in ignore
+        ignore = set(ignore) | simulation.parameters_depending_on("display")
+        parameters = {
+            name: canonical(value) for name, value in vars(simulation).items() if name.isupper() and name not in ignore
+        }
+        description = {
+            "simulation": f"{type(simulation).__module__}.{type(simulation).__qualname__}",
+            "parameters": parameters,
+            "integrator": integrator,
+        }
+
+        digest = hashlib.sha256(json.dumps(description, sort_keys=True).encode())
+        digest.update(np.ascontiguousarray(initial_state, dtype=float).tobytes())
+        return digest.hexdigest()
+
+    def get(self, key: str):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+
+        entry = self.load(key)
+
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.remember(key, entry)
+            return entry
+
+    def put(self, key: str, states, events: list, checkpoint=None) -> None:
+        # Cached states are handed out again by later runs, so they must not change
+        if isinstance(states, np.ndarray):
+            states.flags.writeable = False
+
+        with self.lock:
+            self.remember(key, (states, events, checkpoint))
+        self.save(key, states, events, checkpoint)
+
+    def remember(self, key: str, entry) -> None:
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[0].nbytes
+
+        # Runs larger than the whole memory tier are only kept on disk
+        if entry[0].nbytes <= self.max_bytes:
+            self.entries[key] = entry
+            self.size += entry[0].nbytes
+
+        while self.size > self.max_bytes:
+            self.size -= self.entries.popitem(last=False)[1][0].nbytes
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.related.clear()
+            self.size = 0
+
+    def path(self, key: str) -> pathlib.Path:
+        return self.directory / f"{key}.npz"
+
+    def load(self, key: str):
+        if self.directory is None:
+            return None
+
+        try:
+            with np.load(self.path(key)) as data:
+                states = data["states"] if "states" in data else QuantizedStates.from_arrays(data)
+                events = json.loads(str(data["events"]))
+                checkpoint = from_json(str(data["checkpoint"])) if "checkpoint" in data else None
+            os.utime(self.path(key))
+        except (OSError, KeyError, ValueError):
+            return None
+
+        if isinstance(states, np.ndarray):
+            states.flags.writeable = False
+        for event in events:
+            event["state"] = np.array(event["state"])
+
+        return states, events, checkpoint
+
+    def save(self, key: str, states, events: list, checkpoint=None) -> None:
+        if self.directory is None:
+            return
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        events = json.dumps([{**event, "state": np.asarray(event["state"]).tolist()} for event in events])
+
+        # Written to a temporary file first so other processes never read a half written run
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".npz.tmp")
+        with os.fdopen(handle, "wb") as file:
+            arrays = states.arrays() if isinstance(states, QuantizedStates) else {"states": states}
+            if checkpoint is not None:
+                arrays["checkpoint"] = to_json(checkpoint)
+            np.savez(file, events=events, **arrays)
+        os.replace(temporary, self.path(key))
+
+        self.trim_directory()
+
+    def trim_directory(self) -> None:
+        files = []
+        for file in self.directory.glob("*.npz"):
+            try:
+                stat = file.stat()
+            except OSError:  # removed by another process in the meantime
+                continue
+            files.append((stat.st_mtime, stat.st_size, file))
+
+        size = sum(file_size for _, file_size, _ in files)
+        for _, file_size, file in sorted(files):
+            if size <= self.max_disk_bytes:
+                break
+            size -= file_size
+            file.unlink(missing_ok=True)
@@ -0,0 +1,66 @@
+"""Checkpoints of runs, to resume them after an interruption or extend them past SIM_LENGTH and MAX_SIMS
+
+A checkpoint is the JSON document BaseSimulation.stream() keeps in simulation.checkpoint, holding the initial state, the
+parameters, the integrator, the next step to take, the number of states recorded so far, the float64 state to continue
+from and the events so far. Passing one to stream(resume=...) carries on from there.
+"""
+
+import json
+import os
+import pathlib
+import tempfile
+
+import numpy as np
+
+CHECKPOINT_EVERY = 10240  # states between checkpoints saved by trajectory_file.record(), ten blocks of stream()
+
+# Attributes that may differ between a checkpoint and the run resuming it, the rest must match
+EXTENDABLE = {"SIM_LENGTH", "MAX_SIMS", "STORAGE"}
+
+
+def checkpoint_path(path: pathlib.Path) -> pathlib.Path:
+    # The checkpoint of a trajectory file in progress, removed once the file is complete
+    path = pathlib.Path(path)
+    return path.with_name(f"{path.name}.checkpoint")
+
+
+def to_json(checkpoint: dict) -> str:
+    events = [{**event, "state": np.asarray(event["state"]).tolist()} for event in checkpoint["events"]]
+    return json.dumps({**checkpoint, "events": events})
+
+
+def from_json(text: str) -> dict:
+    checkpoint = json.loads(text)
+    for event in checkpoint["events"]:
+        event["state"] = np.array(event["state"])
+    return checkpoint
+
+
+def save(path: pathlib.Path, checkpoint: dict) -> None:
+    # Written to a temporary file first, so an interruption leaves the previous checkpoint in place
+    path = pathlib.Path(path)
+    handle, temporary = tempfile.mkstemp(dir=path.parent, suffix=".checkpoint.tmp")
+    with os.fdopen(handle, "w") as file:
+        file.write(to_json(checkpoint))
+    os.replace(temporary, path)
+
+
+def load(path: pathlib.Path):
+    # None when there is no readable checkpoint
+    try:
+        return from_json(pathlib.Path(path).read_text())
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def check(simulation, checkpoint: dict, integrator=None) -> None:
+    # Raises ValueError unless simulation can resume from checkpoint
+    simulation_name = f"{type(simulation).__module__}.{type(simulation).__qualname__}"
+    if checkpoint["simulation"] != simulation_name:
+        raise ValueError(f"Checkpoint is of {checkpoint['simulation']}, not {simulation_name}")
+    if checkpoint["integrator"] != integrator:
+        raise ValueError(f"Checkpoint was integrated with {checkpoint['integrator']!r}, not {integrator!r}")
+
+    for name, value in simulation.parameter_values().items():
+        if name not in EXTENDABLE and checkpoint["parameters"].get(name) != value:
+            raise ValueError(f"Checkpoint has {name} = {checkpoint['parameters'].get(name)!r}, not {value!r}")
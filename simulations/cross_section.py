@@ -0,0 +1,108 @@
+"""Scattering angles and cross sections of the scattering simulation over many impact parameters at once
+
+The moving particle travels in a straight line until it touches the static one, and the collision is a single event,
+so each impact parameter is resolved directly from the geometry instead of being stepped through time. The collision
+is elastic between hard spheres, along the line between their centres at contact:
+
+    simulation = scattering.Simulation()
+    result = scatter(simulation, np.linspace(0, 10, 1000))
+    histogram = differential_cross_section(simulation, samples=10**7)
+"""
+
+import numpy as np
+
+BLOCK = 2**20  # impact parameters resolved at once by differential_cross_section()
+
+
+def collide(state, params):
+    """State just after an elastic collision of hard spheres touching in state, with the static particle at rest
+
+    The velocity along the line between the centres is exchanged as for a head on collision of the two masses, which
+    conserves momentum and energy. The normal is at arcsin(b / (r1 + r2)) to the beam, so in the centre of mass frame
+    the deflection is pi - 2 arcsin(b / (r1 + r2)).
+    """
+    state = state.copy()
+    normal = state[:, 0:2] / np.hypot(state[:, 0], state[:, 1])[:, None]
+    masses = params.MOVING_PARTICLE_MASS + params.STATIC_PARTICLE_MASS
+    moving = np.reshape(params.MOVING_PARTICLE_MASS / masses, (-1, 1))
+
+    # Velocity of the moving particle along the normal, shared between the particles in proportion to their masses
+    approach = np.sum(state[:, 2:4] * normal, axis=1, keepdims=True) * normal
+    state[:, 2:4] -= 2 * (1 - moving) * approach
+    state[:, 6:8] = 2 * moving * approach
+
+    return state
+
+
+def scatter(simulation, impact_parameters) -> dict:
+    """Outcome of launching the moving particle at each impact parameter, with the other parameters of simulation
+
+    Returns arrays with one value per impact parameter: whether the particles touched, the angle the moving particle
+    is deflected by in radians, between -pi and pi, its speed afterwards and the speed and angle of the static
+    particle's recoil. Particles that miss carry on undeflected.
+    """
+    impact_parameters = np.asarray(impact_parameters, dtype=float)
+    params, size = simulation.batch_parameters({"b": impact_parameters})
+    contact = params.MOVING_PARTICLE_RADIUS + params.STATIC_PARTICLE_RADIUS
+    touched = np.abs(impact_parameters.ravel()) < contact
+
+    # State at the moment of contact, the static particle sits at the origin until then
+    state = simulation.batch_initial_conditions(params, size)
+    state[:, 0] = -np.sqrt(np.maximum(contact**2 - params.IMPACT_PARAMETER**2, 0))
+    state = np.where(touched[:, None], collide(state, params), state)
+
+    shape = impact_parameters.shape
+    return {
+        "touched": touched.reshape(shape),
+        "angle": np.arctan2(state[:, 3], state[:, 2]).reshape(shape),
+        "speed": np.hypot(state[:, 2], state[:, 3]).reshape(shape),
+        "recoil_angle": np.where(touched, np.arctan2(state[:, 7], state[:, 6]), 0.0).reshape(shape),
+        "recoil_speed": np.hypot(state[:, 6], state[:, 7]).reshape(shape),
+    }
+
+
+def sample_impact_parameters(largest: float, size: int, dimensions: int = 3, rng=None) -> np.ndarray:
+    # Impact parameters of a uniform beam, a disc of radius largest in 3 dimensions or a strip as wide in 2
+    rng = np.random.default_rng(rng)
+    uniform = rng.random(size)
+    return largest * (np.sqrt(uniform) if dimensions == 3 else uniform)
+
+
+def differential_cross_section(
+    simulation, samples: int = 10**6, bins: int = 90, largest=None, dimensions: int = 3, seed=None
+) -> dict:
+    """Monte Carlo estimate of the differential cross section of the moving particle's deflection
+
+    samples impact parameters are drawn from a uniform beam wide enough to cover every collision and binned by the
+    size of their deflection angle from 0 to 180 degrees. In 3 dimensions the collision is taken to be symmetric about
+    the beam axis and the result is dsigma/dOmega in m^2 per steradian, in 2 dimensions it is dsigma/dtheta in m per
+    radian for one side of the axis. Uncertainties are the standard errors from the count in each bin.
+
+    Particles that miss aren't deflected and are left out, so the total is the cross section for touching at all,
+    pi (r1 + r2)^2 in 3 dimensions or r1 + r2 in 2.
+    """
+    contact = simulation.MOVING_PARTICLE_RADIUS + simulation.STATIC_PARTICLE_RADIUS
+    largest = contact if largest is None else largest
+    beam = np.pi * largest**2 if dimensions == 3 else largest
+
+    rng = np.random.default_rng(seed)
+    edges = np.linspace(0, np.pi, bins + 1)
+    counts = np.zeros(bins, dtype=np.int64)
+
+    # In blocks, so memory stays bounded however many samples are asked for
+    for start in range(0, samples, BLOCK):
+        result = scatter(simulation, sample_impact_parameters(largest, min(BLOCK, samples - start), dimensions, rng))
+        angles = np.abs(result["angle"][result["touched"]])
+        counts += np.bincount(np.minimum((angles / np.pi * bins).astype(int), bins - 1), minlength=bins)
+
+    width = 2 * np.pi * (np.cos(edges[:-1]) - np.cos(edges[1:])) if dimensions == 3 else np.diff(edges)
+    cross_section = counts / samples * beam / width
+
+    return {
+        "edges": edges,
+        "counts": counts,
+        "cross_section": cross_section,
+        "error": cross_section / np.sqrt(np.maximum(counts, 1)),
+        "total": counts.sum() / samples * beam,
+        "total_error": np.sqrt(counts.sum()) / samples * beam,
+    }
@@ -1,12 +1,27 @@
 """Simulation of a damped oscillator"""
 
+from typing import ClassVar
+
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib import animation
-from .simulation import BaseSimulation  # type: ignore
+
+from .simulation import BaseSimulation, Event, cumulative_integral  # type: ignore
 
 
 class Simulation(BaseSimulation):
+    PARAMETERS: ClassVar[dict] = {
+        "start_angle": "START_ANGLE",
+        "damping": "DAMPING_CONSTANT",
+        "length": "STRING_LENGTH",
+        "gravity": "G_EARTH",
+        "mass": "BOB_MASS",
+    }
+    POSITIONS: ClassVar[list] = [0]
+    VELOCITIES: ClassVar[list] = [1]
+    SCHEMA: ClassVar[list] = [
+        {"name": "theta", "label": "Angular Position", "unit": "rad"},
+        {"name": "omega", "label": "Angular Velocity", "unit": "rad/s"},
+    ]
+
     def __init__(self):
         super().__init__("Damped Oscillator", 2)
 
@@ -15,7 +30,7 @@ class Simulation(BaseSimulation):
         self.START_ANGLE = 45  # angle of the intial sendoff in degrees
         self.STRING_LENGTH = 1  # length of the string in meters
 
-        self.state = np.zeros((1, self.state_length))  # theta, omega
+        self.INTEGRATOR = "semi_implicit_euler"
 
     def initial_conditions(self):
         state = np.zeros(self.state_length)
@@ -23,32 +38,46 @@ class Simulation(BaseSimulation):
         state[0] = np.deg2rad(self.START_ANGLE)  # angle of the bob
         state[1] = 0  # angular velocity of the bob
 
-        self.state[0] = state
+        self.trajectory.start(state)
+
+        return state
+
+    def batch_initial_conditions(self, params, size):
+        state = np.zeros((size, self.state_length))
+
+        state[:, 0] = np.deg2rad(params.START_ANGLE)
+        state[:, 1] = 0
 
         return state
 
-    def simulate(self, initial_state):
-        state = np.copy(initial_state)
-        simulation = [np.copy(state)]
+    def derivatives(self, t, state, params):
+        derivatives = np.empty_like(state)
 
-        for i in range(self.SIM_LENGTH * self.SIMS_PER_SECOND):
-            state[1] += ((-self.DAMPING_CONSTANT * state[1]) / (self.BOB_MASS * self.STRING_LENGTH**2)) - (
-                (self.G_EARTH * np.sin(state[0])) / self.STRING_LENGTH
-            ) / self.SIMS_PER_SECOND
-            state[0] += state[1] / self.SIMS_PER_SECOND
+        derivatives[..., 0] = state[..., 1]
+        derivatives[..., 1] = (
+            (-params.DAMPING_CONSTANT * state[..., 1]) / (params.BOB_MASS * params.STRING_LENGTH**2)
+        ) - ((params.G_EARTH * np.sin(state[..., 0])) / params.STRING_LENGTH)
 
-            if abs(state[1]) < 0.001 and abs(state[0]) < 0.001:
-                break
-            if i > self.MAX_SIMS:
-                break
+        return derivatives
 
-            simulation.append(np.copy(state))
-            self.state = np.vstack([self.state, state])
+    def distance_from_rest(self, t, state, params):
+        return np.maximum(abs(state[..., 0]), abs(state[..., 1])) - 0.001
 
-        return np.array(simulation)
+    def get_events(self) -> list:
+        return [Event("rest", self.distance_from_rest, direction=-1, terminal=True)]
+
+    def stopped(self, state, params):
+        # Catches a pendulum that starts at rest, which never crosses into it
+        return (abs(state[..., 1]) < 0.001) & (abs(state[..., 0]) < 0.001)
 
     def get_figure(self):
-        simulation = self.simulate(self.initial_conditions())
+        import matplotlib.pyplot as plt
+
+        simulation = self.playback_states()
+
+        # Bob positions of every frame
+        bob_x = self.STRING_LENGTH * np.sin(simulation[:, 0])
+        bob_y = -self.STRING_LENGTH * np.cos(simulation[:, 0])
 
         fig = plt.figure()
         (line,) = plt.plot([], [], lw=2)
@@ -60,26 +89,19 @@ class Simulation(BaseSimulation):
         ax.set_ylim(-self.STRING_LENGTH * 1.25, self.STRING_LENGTH * 0.5)
 
         def animate_func(i):
-            self.offset = i
-            data = simulation[:, [0, 1]]
-            x = self.STRING_LENGTH * np.sin(data[i, 0])
-            y = -self.STRING_LENGTH * np.cos(data[i, 0])
+            line.set_data([0, bob_x[i]], [0, bob_y[i]])
+            dot.set_data(bob_x[i : i + 1], bob_y[i : i + 1])
 
-            line.set_data([0, x], [0, y])
-            dot.set_data([x], [y])
+            return line, dot
 
-            return line
-
-        anim = animation.FuncAnimation(
-            fig, animate_func, frames=range(len(simulation)), interval=(1000 / self.SIMS_PER_SECOND)
-        )
+        anim = self.animate(fig, animate_func, len(simulation))
 
         plt.axis("scaled")
 
         return fig, anim
 
     def update_variables(self, variables) -> bool:
-        self.state = np.zeros((1, self.state_length))
+        self.trajectory.reset()
         if "start_angle" in variables:
             self.START_ANGLE = int(variables["start_angle"])
         if "damping" in variables:
@@ -110,15 +132,22 @@ class Simulation(BaseSimulation):
 
         return fields
 
-    def get_readings(self) -> dict:
-        try:
-            state = self.state[self.offset]
-        except IndexError:
-            state = self.state[-1]
+    def invariants(self, states, times) -> dict:
+        # Damping takes DAMPING_CONSTANT * omega^2 of power out of the swing, which adds back to a constant total
+        theta, omega = states[..., 0], states[..., 1]
+        inertia = self.BOB_MASS * self.STRING_LENGTH**2
+
+        energy = 0.5 * inertia * omega**2 + self.BOB_MASS * self.G_EARTH * self.STRING_LENGTH * (1 - np.cos(theta))
+        lost = cumulative_integral(self.DAMPING_CONSTANT * omega.astype(float) ** 2, times)
 
-        readings = {
-            "theta": {"label": "Angular Position", "value": round(np.rad2deg(state[0]), self.ROUND)},
-            "omega": {"label": "Angular Velocity", "value": round(state[1], self.ROUND)},
+        return {
+            "energy": {"label": "Mechanical Energy", "unit": "J", "values": energy, "conserved": False},
+            "damped": {"label": "Energy Lost to Damping", "unit": "J", "values": lost, "conserved": False},
+            "total_energy": {"label": "Total Energy", "unit": "J", "values": energy + lost, "conserved": True},
         }
 
+    def reading_columns(self, states) -> dict:
+        readings = super().reading_columns(states)
+        readings["theta"].update(unit="deg", values=np.rad2deg(states[:, 0]))
+
         return readings
@@ -0,0 +1,357 @@
+"""Simulation of a gas of hard spheres bouncing around a box"""
+
+from typing import ClassVar
+
+import numpy as np
+
+from .simulation import BaseSimulation  # type: ignore
+
+# Half of the 3 x 3 block of cells around a cell, so each pair of neighbouring cells is only visited once
+HALF_SHELL = [(0, 0), (1, -1), (1, 0), (1, 1), (0, 1)]
+MAX_ROUNDS = 100000  # rounds of collisions resolved per step, a safeguard against particles stuck together
+
+
+def dot(u, v):
+    # Dot products of rows of 2D vectors, written out as reducing along an axis of two is several times slower
+    return u[:, 0] * v[:, 0] + u[:, 1] * v[:, 1]
+
+
+def candidate_pairs(positions, cell_size: float, box: float):
+    """Pairs of particles no further apart than cell_size, as two arrays of indices
+
+    Particles are only compared with those in the same or neighbouring cells of a uniform grid, so with cells a little
+    larger than the distance two particles can close in a step the work grows with the number of particles rather
+    than its square.
+    """
+    cells_per_side = max(int(box // cell_size), 1)
+    cell = np.clip((positions * (cells_per_side / box)).astype(int), 0, cells_per_side - 1)
+    index = cell[:, 0] * cells_per_side + cell[:, 1]
+
+    # Particles sorted by cell, so the particles of a cell are a contiguous range of order
+    order = np.argsort(index, kind="stable")
+    cells = np.arange(cells_per_side**2)
+    starts = np.searchsorted(index[order], cells)
+    ends = np.searchsorted(index[order], cells, side="right")
+
+    # Every particle paired with every particle of each of its neighbouring cells, one row of the grid per cell
+    shell = np.array(HALF_SHELL)
+    x, y = cell[:, 0] + shell[:, :1], cell[:, 1] + shell[:, 1:]
+    inside = (x >= 0) & (x < cells_per_side) & (y >= 0) & (y < cells_per_side)
+    neighbour = np.where(inside, x * cells_per_side + y, 0)
+    counts = np.where(inside, ends[neighbour] - starts[neighbour], 0).ravel()
+
+    first = np.repeat(np.tile(np.arange(len(positions)), len(shell)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    second = order[np.repeat(starts[neighbour].ravel(), counts) + offsets]
+
+    # Separate coordinates, as gathering rows of two is slower than gathering each column. Pairs in the same cell,
+    # the first row of the grid, are found from both ends and only kept once
+    dx = positions[:, 0][first] - positions[:, 0][second]
+    dy = positions[:, 1][first] - positions[:, 1][second]
+    same_cell = np.repeat(np.arange(len(counts)) < len(positions), counts)
+    keep = (dx**2 + dy**2 <= cell_size**2) & ((first < second) | ~same_cell)
+
+    return first[keep], second[keep]
+
+
+class Simulation(BaseSimulation):
+    PARAMETERS: ClassVar[dict] = {
+        "particles": "PARTICLES",
+        "radius": "PARTICLE_RADIUS",
+        "speed": "PARTICLE_SPEED",
+        "mass": "PARTICLE_MASS",
+        "box": "BOX_SIZE",
+        "seed": "SEED",
+    }
+    SUPPORTS_BATCH = False  # advance() resolves the collisions of one box at a time
+
+    def __init__(self):
+        self.PARTICLES = 500  # number of particles
+        super().__init__("Hard Sphere Gas", 4 * self.PARTICLES)  # x, y, vx, vy of each particle in turn
+
+        self.PARTICLE_RADIUS = 0.2  # radius of the particles in m
+        self.PARTICLE_SPEED = 5  # starting speed of every particle in m/s
+        self.PARTICLE_MASS = 1  # mass of each particle in kg
+        self.BOX_SIZE = 20  # side of the square box in m
+        self.SEED = 0  # seed of the random starting positions and directions
+
+        # Every particle is recorded each frame, so runs are kept short and in single precision
+        self.SIM_LENGTH = 30
+        self.STORAGE = "float32"
+        self.INTEGRATOR = "explicit_euler"  # unused, the free flight between collisions is exact
+
+    @property
+    def POSITIONS(self):
+        return (np.arange(self.PARTICLES)[:, None] * 4 + [0, 1]).ravel()
+
+    @property
+    def VELOCITIES(self):
+        return (np.arange(self.PARTICLES)[:, None] * 4 + [2, 3]).ravel()
+
+    @property
+    def SCHEMA(self):
+        columns = []
+        for particle in range(1, self.PARTICLES + 1):
+            columns += [
+                {"name": f"x{particle}", "label": f"X Position of Particle {particle}", "unit": "m"},
+                {"name": f"y{particle}", "label": f"Y Position of Particle {particle}", "unit": "m"},
+                {"name": f"vx{particle}", "label": f"X Velocity of Particle {particle}", "unit": "m/s"},
+                {"name": f"vy{particle}", "label": f"Y Velocity of Particle {particle}", "unit": "m/s"},
+            ]
+        return columns
+
+    def lattice(self):
+        # Sites far enough apart that particles placed on them can't overlap, however they are nudged
+        spacing = 2.2 * self.PARTICLE_RADIUS
+        sites_per_side = int((self.BOX_SIZE - 2 * self.PARTICLE_RADIUS) // spacing) + 1
+        sites = (np.arange(sites_per_side) + 0.5) * (self.BOX_SIZE / sites_per_side)
+        return np.stack(np.meshgrid(sites, sites), axis=-1).reshape(-1, 2), self.BOX_SIZE / sites_per_side
+
+    def state_size(self):
+        return 4 * self.PARTICLES
+
+    def initial_conditions(self):
+        self.resize()
+        rng = np.random.default_rng(self.SEED)
+        sites, spacing = self.lattice()
+
+        positions = sites[rng.choice(len(sites), self.PARTICLES, replace=False)]
+        positions += rng.uniform(-0.5, 0.5, positions.shape) * (spacing - 2.1 * self.PARTICLE_RADIUS)
+
+        directions = rng.uniform(0, 2 * np.pi, self.PARTICLES)
+        velocities = self.PARTICLE_SPEED * np.stack([np.cos(directions), np.sin(directions)], axis=-1)
+
+        state = np.concatenate([positions, velocities], axis=1).ravel()
+
+        self.trajectory.start(state)
+
+        return state
+
+    def derivatives(self, t, state, params):
+        # Free flight between collisions
+        derivatives = np.zeros_like(state)
+        derivatives[..., self.POSITIONS] = state[..., self.VELOCITIES]
+
+        return derivatives
+
+    def advance(self, integrator, events, t, state, dt):
+        """Moves the particles on by dt, resolving every collision on the way in the order they happen
+
+        Each particle has its own time within the step, the time of its last collision. Every round finds the first
+        collision of each particle with another particle or a wall, resolves all those that come before every event of
+        the particles around them, then looks again for the particles that changed, until no collisions are left.
+        Rounds only look at the pairs and particles with an event within the step, which are few.
+        """
+        particles = state.reshape(-1, 4)
+        positions, velocities = particles[:, :2].copy(), particles[:, 2:].copy()
+        times = np.zeros(len(positions))
+
+        radius, box = self.PARTICLE_RADIUS, self.BOX_SIZE
+        low, high = radius, box - radius
+
+        def pairs_within_reach():
+            # Wide enough for two particles to be paired if they could touch by the end of the step, moving at up to
+            # half as fast again as the fastest particle now. Particle positions may be at different times in the step
+            fastest = np.sqrt(dot(velocities, velocities).max()) if len(velocities) else 0
+            return (*candidate_pairs(positions, 2 * radius + 3 * fastest * dt, box), 1.5 * fastest)
+
+        first, second, reach = pairs_within_reach()
+
+        def pair_times(pairs):
+            # Time each pair touches while approaching, inf if it doesn't, from where both particles were at time 0.
+            # Columns are gathered separately, see dot()
+            i, j = first[pairs], second[pairs]
+            start = np.maximum(times[i], times[j])
+            origins = positions - velocities * times[:, None]
+
+            offset_x = origins[:, 0][j] - origins[:, 0][i]
+            offset_y = origins[:, 1][j] - origins[:, 1][i]
+            closing_x = velocities[:, 0][j] - velocities[:, 0][i]
+            closing_y = velocities[:, 1][j] - velocities[:, 1][i]
+
+            a = closing_x**2 + closing_y**2
+            b = offset_x * closing_x + offset_y * closing_y
+            c = offset_x**2 + offset_y**2 - (2 * radius) ** 2
+            discriminant = b**2 - a * c
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                touch = (-b - np.sqrt(discriminant)) / a
+
+            # Pairs left overlapping by rounding collide at once if they are still approaching
+            separation_x, separation_y = offset_x + closing_x * start, offset_y + closing_y * start
+            approaching = separation_x * closing_x + separation_y * closing_y < 0
+            overlapping = separation_x**2 + separation_y**2 < (2 * radius) ** 2
+
+            touch = np.where((discriminant > 0) & (a > 0) & (touch >= start), touch, np.inf)
+            return np.where(approaching, np.where(overlapping, start, touch), np.inf)
+
+        def wall_times(particles):
+            # Time each particle reaches a wall while heading into it, per axis
+            with np.errstate(divide="ignore", invalid="ignore"):
+                wall = np.where(velocities[particles] > 0, high, low)
+                hit = times[particles, None] + (wall - positions[particles]) / velocities[particles]
+
+            heading = velocities[particles] != 0
+            return np.where(heading, np.maximum(hit, times[particles, None]), np.inf)
+
+        collisions = pair_times(np.arange(len(first)))
+        walls = wall_times(np.arange(len(positions)))
+        first_wall = walls.min(axis=1)
+
+        for _ in range(MAX_ROUNDS):
+            # First event of each particle, only those within the step matter
+            due = np.flatnonzero(collisions < dt)
+            earliest = first_wall.copy()
+            np.minimum.at(earliest, first[due], collisions[due])
+            np.minimum.at(earliest, second[due], collisions[due])
+
+            busy = earliest < dt
+            if not busy.any():
+                break
+
+            # Events are only resolved before any event of the particles around them, which could otherwise send
+            # another particle into theirs first. Particles with no event in the step don't hold any back
+            near = np.flatnonzero(busy[first] & busy[second])
+            nearby = earliest.copy()
+            np.minimum.at(nearby, first[near], earliest[second[near]])
+            np.minimum.at(nearby, second[near], earliest[first[near]])
+
+            colliding = due[(collisions[due] == nearby[first[due]]) & (collisions[due] == nearby[second[due]])]
+
+            # A particle touching two others at the same instant is resolved with one of them at a time
+            involved = np.bincount(np.concatenate([first[colliding], second[colliding]]), minlength=len(positions))
+            unique = (involved[first[colliding]] == 1) & (involved[second[colliding]] == 1)
+            colliding = colliding[unique] if unique.any() else colliding[:1]
+
+            i, j = first[colliding], second[colliding]
+            at = collisions[colliding]
+            changed = np.zeros(len(positions), dtype=bool)
+            changed[i] = changed[j] = True
+
+            bouncing = np.flatnonzero((first_wall == nearby) & busy & ~changed)
+            wall_at = earliest[bouncing]
+
+            # Particles are moved to their collision, where equal masses swap their velocities along the line between
+            # the centres and walls reverse the velocity into them
+            positions[i] += velocities[i] * (at - times[i])[:, None]
+            positions[j] += velocities[j] * (at - times[j])[:, None]
+            times[i] = times[j] = at
+
+            normal = positions[j] - positions[i]
+            normal /= np.sqrt(dot(normal, normal))[:, None]
+            exchanged = dot(velocities[i] - velocities[j], normal)[:, None] * normal
+            velocities[i] -= exchanged
+            velocities[j] += exchanged
+
+            positions[bouncing] += velocities[bouncing] * (wall_at - times[bouncing])[:, None]
+            times[bouncing] = wall_at
+            hitting = walls[bouncing] == wall_at[:, None]
+            velocities[bouncing] = np.where(hitting, -velocities[bouncing], velocities[bouncing])
+            changed[bouncing] = True
+
+            walls[changed] = wall_times(np.flatnonzero(changed))
+            first_wall[changed] = walls[changed].min(axis=1)
+
+            speeds = np.concatenate([dot(velocities[i], velocities[i]), dot(velocities[j], velocities[j])])
+            if speeds.max(initial=0) > reach**2:
+                # A collision sped a particle up past what the pairs allow for, so they are found again
+                first, second, reach = pairs_within_reach()
+                collisions = pair_times(np.arange(len(first)))
+            else:
+                # Only events of the particles that changed need looking at again
+                stale = np.flatnonzero(changed[first] | changed[second])
+                collisions[stale] = pair_times(stale)
+
+        positions += velocities * (dt - times)[:, None]
+        positions = np.clip(positions, low, high)
+
+        stepped = np.concatenate([positions, velocities], axis=1).ravel()
+        return stepped, np.zeros(np.shape(state)[:-1], dtype=bool), []
+
+    def get_figure(self):
+        import matplotlib.pyplot as plt
+        from matplotlib.collections import EllipseCollection
+
+        simulation = self.playback_states()
+
+        fig = plt.figure()
+        ax = plt.gca()
+        ax.set_xlim(0, self.BOX_SIZE)
+        ax.set_ylim(0, self.BOX_SIZE)
+        ax.set_aspect("equal")
+
+        # Positions of every particle in every frame, a view of the states
+        positions = simulation.reshape(len(simulation), -1, 4)[:, :, :2]
+
+        # One collection for every particle, sized in data units so the particles are drawn at their true size
+        diameters = np.full(self.PARTICLES, 2 * self.PARTICLE_RADIUS)
+        particles = EllipseCollection(
+            diameters, diameters, 0, units="xy", offsets=positions[0], offset_transform=ax.transData
+        )
+        ax.add_collection(particles)
+
+        def animate_func(i):
+            particles.set_offsets(positions[i])
+            return (particles,)
+
+        anim = self.animate(fig, animate_func, len(simulation))
+
+        return fig, anim
+
+    def update_variables(self, variables) -> bool:
+        self.trajectory.reset()
+
+        previous = {name: getattr(self, attribute) for name, attribute in self.PARAMETERS.items()}
+        if "particles" in variables:
+            self.PARTICLES = int(variables["particles"])
+        if "radius" in variables:
+            self.PARTICLE_RADIUS = float(variables["radius"])
+        if "speed" in variables:
+            self.PARTICLE_SPEED = float(variables["speed"])
+        if "mass" in variables:
+            self.PARTICLE_MASS = float(variables["mass"])
+        if "box" in variables:
+            self.BOX_SIZE = float(variables["box"])
+        if "seed" in variables:
+            self.SEED = int(variables["seed"])
+
+        # Rejected when the particles don't fit in the box
+        if len(self.lattice()[0]) < self.PARTICLES:
+            for name, value in previous.items():
+                setattr(self, self.PARAMETERS[name], value)
+            return False
+
+        self.resize()
+
+        return True
+
+    def get_fields(self) -> dict:
+        fields = {
+            "particles": {"type": "integer", "value": self.PARTICLES, "label": "Number of Particles", "min": 1},
+            "radius": {"type": "float", "value": self.PARTICLE_RADIUS, "label": "Particle Radius", "min": 0.001},
+            "speed": {"type": "float", "value": self.PARTICLE_SPEED, "label": "Starting Speed", "min": 0},
+            "mass": {"type": "float", "value": self.PARTICLE_MASS, "label": "Particle Mass", "min": 0.001},
+            "box": {"type": "float", "value": self.BOX_SIZE, "label": "Box Size", "min": 1},
+            "seed": {"type": "integer", "value": self.SEED, "label": "Random Seed", "min": 0},
+        }
+
+        return fields
+
+    def invariants(self, states, times) -> dict:
+        # The walls reverse momentum, so only the energy is conserved
+        velocities = states.reshape(*np.shape(states)[:-1], -1, 4)[..., 2:].astype(float)
+        energy = 0.5 * self.PARTICLE_MASS * (velocities**2).sum(axis=(-2, -1))
+
+        return {"energy": {"label": "Kinetic Energy", "unit": "J", "values": energy, "conserved": True}}
+
+    def reading_columns(self, states) -> dict:
+        # Summaries of the whole gas, rather than a reading per particle
+        velocities = states.reshape(len(states), -1, 4)[:, :, 2:]
+        speeds = np.sqrt((velocities**2).sum(axis=-1))
+
+        readings = {
+            "mean_speed": {"label": "Mean Speed", "unit": "m/s", "values": speeds.mean(axis=-1)},
+            "fastest": {"label": "Fastest Particle", "unit": "m/s", "values": speeds.max(axis=-1)},
+        }
+
+        return readings
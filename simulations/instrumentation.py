@@ -0,0 +1,153 @@
+"""Optional timing of the hot paths, as counters, histograms and a trace for chrome://tracing or Perfetto
+
+Disabled by default, in which case a span costs one attribute check. Set SIMULATIONS_PROFILE=1 to enable it, or
+SIMULATIONS_TRACE to a file name to also write the trace there when the program exits:
+
+    SIMULATIONS_TRACE=trace.json python main.py
+"""
+
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import ClassVar
+
+TRACE_LENGTH = 200000  # spans kept for the trace, the oldest are dropped first
+
+
+class Histogram:
+    """Count, total and extremes of durations, with buckets spaced a quarter of a decade apart from 1 µs to 100 s"""
+
+    BOUNDS: ClassVar[list] = [10 ** (exponent / 4) for exponent in range(-24, 9)]
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = float("inf")
+        self.maximum = 0.0
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.minimum = min(self.minimum, seconds)
+        self.maximum = max(self.maximum, seconds)
+        self.buckets[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+
+    def percentile(self, fraction: float) -> float:
+        # Upper bound of the bucket the percentile falls in, so within a factor of 1.8 of the true value
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= fraction * self.count:
+                return min(self.BOUNDS[index] if index < len(self.BOUNDS) else self.maximum, self.maximum)
+        return 0.0
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "min": self.minimum if self.count else 0.0,
+            "max": self.maximum,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+        }
+
+
+class Span:
+    def __init__(self, profiler, name: str, arguments: dict):
+        self.profiler = profiler
+        self.name = name
+        self.arguments = arguments
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, self.start, time.perf_counter() - self.start, self.arguments)
+
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Profiler:
+    """Counters and duration histograms of named spans, plus a trace of the most recent spans"""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters: dict = {}
+            self.histograms: dict = {}
+            self.trace: deque = deque(maxlen=TRACE_LENGTH)
+
+    def span(self, name: str, **arguments):
+        # Times a with block, the arguments are shown on the span in the trace viewer
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, arguments)
+
+    def record(self, name: str, start: float, seconds: float, arguments=None) -> None:
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].add(seconds)
+            self.trace.append((name, start, seconds, threading.get_ident(), arguments or {}))
+
+    def count(self, name: str, amount: int = 1) -> None:
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "time": time.perf_counter() - self.origin,
+                "counters": dict(self.counters),
+                "histograms": {name: histogram.summary() for name, histogram in self.histograms.items()},
+            }
+
+    def trace_events(self) -> list:
+        # Complete events of the Trace Event Format, in microseconds since the profiler was created
+        with self.lock:
+            spans = list(self.trace)
+
+        return [
+            {
+                "name": name,
+                "ph": "X",
+                "ts": (start - self.origin) * 1e6,
+                "dur": seconds * 1e6,
+                "pid": os.getpid(),
+                "tid": thread,
+                "args": {key: str(value) for key, value in arguments.items()},
+            }
+            for name, start, seconds, thread, arguments in spans
+        ]
+
+    def export_trace(self, path) -> None:
+        with open(path, "w") as file:
+            json.dump({"traceEvents": self.trace_events(), "otherData": self.snapshot()}, file)
+
+
+profiler = Profiler(enabled=bool(os.environ.get("SIMULATIONS_PROFILE") or os.environ.get("SIMULATIONS_TRACE")))
+
+if os.environ.get("SIMULATIONS_TRACE"):
+    atexit.register(profiler.export_trace, os.environ["SIMULATIONS_TRACE"])
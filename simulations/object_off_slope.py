@@ -1,12 +1,34 @@
 """Simulation of throwing an object off of a slope"""
 
+from typing import ClassVar
+
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib import animation
-from .simulation import BaseSimulation  # type: ignore
+
+from . import playback
+from .simulation import BaseSimulation, Event, cumulative_integral  # type: ignore
 
 
 class Simulation(BaseSimulation):
+    PARAMETERS: ClassVar[dict] = {
+        "slope_angle": "SLOPE_ANGLE",
+        "launch_angle": "LAUNCH_ANGLE",
+        "speed": "LAUNCH_SPEED",
+        "gravity": "G_EARTH",
+        "mass": "PARTICLE_MASS",
+        "air_resistance": "AIR_RESISTANCE",
+        "drag_coefficient": "DRAG_COEFFICIENT",
+        "air_density": "AIR_DENSITY",
+    }
+    DEPENDENCIES: ClassVar[dict] = {"SLOPE_ANGLE": "events"}  # only decides where the object lands
+    POSITIONS: ClassVar[list] = [0, 1]
+    VELOCITIES: ClassVar[list] = [2, 3]
+    SCHEMA: ClassVar[list] = [
+        {"name": "x", "label": "X Position", "unit": "m"},
+        {"name": "y", "label": "Y Position", "unit": "m"},
+        {"name": "vx", "label": "X Velocity", "unit": "m/s"},
+        {"name": "vy", "label": "Y Velocity", "unit": "m/s"},
+    ]
+
     def __init__(self):
         super().__init__("Launching an Object Off of a Slope", 4)
 
@@ -19,7 +41,7 @@ class Simulation(BaseSimulation):
         self.AIR_DENSITY = 1.225  # density of air in kg/m^3
         self.DRAG_COEFFICIENT = 0.47  # drag coefficient of a sphere
 
-        self.state = np.zeros((1, self.state_length))  # x, y, vx, vy
+        self.INTEGRATOR = "rk4"  # exact for the drag free flight, so the landing point is too
 
     def initial_conditions(self):
         state = np.zeros(self.state_length)
@@ -29,45 +51,80 @@ class Simulation(BaseSimulation):
         state[2] = self.LAUNCH_SPEED * np.cos(np.deg2rad(self.LAUNCH_ANGLE))  # x velocity of the particle
         state[3] = self.LAUNCH_SPEED * np.sin(np.deg2rad(self.LAUNCH_ANGLE))  # y velocity of the particle
 
-        self.state[0] = state
+        self.trajectory.start(state)
+
+        return state
+
+    def batch_initial_conditions(self, params, size):
+        state = np.zeros((size, self.state_length))
+
+        state[:, 2] = params.LAUNCH_SPEED * np.cos(np.deg2rad(params.LAUNCH_ANGLE))
+        state[:, 3] = params.LAUNCH_SPEED * np.sin(np.deg2rad(params.LAUNCH_ANGLE))
 
         return state
 
-    def simulate(self, initial_state):
-        state = np.copy(initial_state)
-        simulation = [np.copy(state)]
-
-        for i in range(self.SIM_LENGTH * self.SIMS_PER_SECOND):
-            if not self.AIR_RESISTANCE:
-                state[0] += state[2] / self.SIMS_PER_SECOND
-                state[1] += state[3] / self.SIMS_PER_SECOND
-                state[2] = state[2]
-                state[3] -= self.G_EARTH / self.SIMS_PER_SECOND
-            else:
-                state[0] += state[2] / self.SIMS_PER_SECOND
-                state[1] += state[3] / self.SIMS_PER_SECOND
-                state[2] -= (
-                    (0.5 * self.AIR_DENSITY * self.DRAG_COEFFICIENT * state[2] * abs(state[2]))
-                    / self.PARTICLE_MASS
-                    / self.SIMS_PER_SECOND
-                )
-                state[3] -= (
-                    self.G_EARTH
-                    + ((0.5 * self.AIR_DENSITY * self.DRAG_COEFFICIENT * state[3] * abs(state[3])) / self.PARTICLE_MASS)
-                ) / self.SIMS_PER_SECOND
-
-            if state[1] < -np.tan(np.deg2rad(self.SLOPE_ANGLE)) * state[0]:
-                break
-            if i > self.MAX_SIMS:
-                break
-
-            simulation.append(np.copy(state))
-            self.state = np.vstack([self.state, state])
-
-        return np.array(simulation)
+    def derivatives(self, t, state, params):
+        derivatives = np.empty_like(state)
+
+        # AIR_RESISTANCE multiplies the drag so the same derivatives cover both cases and mixed batches
+        drag = params.AIR_RESISTANCE * 0.5 * params.AIR_DENSITY * params.DRAG_COEFFICIENT / params.PARTICLE_MASS
+
+        derivatives[..., 0] = state[..., 2]
+        derivatives[..., 1] = state[..., 3]
+        derivatives[..., 2] = -drag * state[..., 2] * abs(state[..., 2])
+        derivatives[..., 3] = -(params.G_EARTH + drag * state[..., 3] * abs(state[..., 3]))
+
+        return derivatives
+
+    def exact_solution(self, initial_state, params):
+        if np.any(params.AIR_RESISTANCE):
+            return None
+
+        x, y, vx, vy = (initial_state[..., i] for i in range(4))
+
+        # Projectile motion, landing when the height above the slope falls back to zero
+        slope = np.tan(np.deg2rad(params.SLOPE_ANGLE))
+        rate = vy + slope * vx
+        landing = (rate + np.sqrt(rate**2 + 2 * params.G_EARTH * (y + slope * x))) / params.G_EARTH
+
+        def states_at(t):
+            return np.stack(
+                [
+                    x + vx * t,
+                    y + vy * t - 0.5 * params.G_EARTH * t**2,
+                    vx + 0 * t,
+                    vy - params.G_EARTH * t,
+                ],
+                axis=-1,
+            )
+
+        return states_at, ("landing", landing)
+
+    def invariants(self, states, times) -> dict:
+        # Drag takes power out of the flight, which adds back to a constant total
+        velocities = states[..., 2:4].astype(float)
+        energy = 0.5 * self.PARTICLE_MASS * (velocities**2).sum(axis=-1)
+        energy = energy + self.PARTICLE_MASS * self.G_EARTH * states[..., 1]
+
+        drag = self.AIR_RESISTANCE * 0.5 * self.AIR_DENSITY * self.DRAG_COEFFICIENT
+        lost = cumulative_integral(drag * (np.abs(velocities) ** 3).sum(axis=-1), times)
+
+        return {
+            "energy": {"label": "Mechanical Energy", "unit": "J", "values": energy, "conserved": False},
+            "drag": {"label": "Energy Lost to Drag", "unit": "J", "values": lost, "conserved": False},
+            "total_energy": {"label": "Total Energy", "unit": "J", "values": energy + lost, "conserved": True},
+        }
+
+    def height_above_slope(self, t, state, params):
+        return state[..., 1] + np.tan(np.deg2rad(params.SLOPE_ANGLE)) * state[..., 0]
+
+    def get_events(self) -> list:
+        return [Event("landing", self.height_above_slope, direction=-1, terminal=True)]
 
     def get_figure(self):
-        simulation = self.simulate(self.initial_conditions())
+        import matplotlib.pyplot as plt
+
+        simulation = self.playback_states()
 
         fig = plt.figure()
         scatter = plt.scatter(self.state[0, 0], self.state[0, 1], s=100)
@@ -77,25 +134,24 @@ class Simulation(BaseSimulation):
         line_y = -np.tan(np.deg2rad(self.SLOPE_ANGLE)) * line_x
         plt.plot(line_x, line_y)
 
-        # Plots an invisible line to set the axis limits
-        plt.plot(simulation[:, 0], simulation[:, 1], visible=False)
+        # Plots an invisible line to set the axis limits, decimated as only its extremes matter
+        path = playback.decimate(self.state[:, :2])
+        plt.plot(path[:, 0], path[:, 1], visible=False)
+
+        positions = simulation[:, :2]  # a view, slicing doesn't copy the trajectory
 
         def animate_func(i):
-            self.offset = i
-            data = simulation[:, [0, 1]]
-            scatter.set_offsets(data[i])
-            return scatter
+            scatter.set_offsets(positions[i])
+            return (scatter,)
 
-        anim = animation.FuncAnimation(
-            fig, animate_func, frames=range(len(simulation)), interval=(1000 / self.SIMS_PER_SECOND)
-        )
+        anim = self.animate(fig, animate_func, len(simulation))
 
         plt.axis("scaled")
 
         return fig, anim
 
     def update_variables(self, variables) -> bool:
-        self.state = np.zeros((1, self.state_length))
+        self.trajectory.reset()
         if "slope_angle" in variables:
             self.SLOPE_ANGLE = int(variables["slope_angle"])
         if "launch_angle" in variables:
@@ -140,18 +196,3 @@ class Simulation(BaseSimulation):
         }
 
         return fields
-
-    def get_readings(self) -> dict:
-        try:
-            state = self.state[self.offset]
-        except IndexError:
-            state = self.state[-1]
-
-        readings = {
-            "x": {"label": "X Position", "value": round(state[0], self.ROUND)},
-            "y": {"label": "Y Position", "value": round(state[1], self.ROUND)},
-            "vx": {"label": "X Velocity", "value": round(state[2], self.ROUND)},
-            "vy": {"label": "Y Velocity", "value": round(state[3], self.ROUND)},
-        }
-
-        return readings
@@ -0,0 +1,241 @@
+"""Phase portrait of the damped oscillator, a grid of pendulums started across phase space and advanced together"""
+
+from types import SimpleNamespace
+from typing import ClassVar
+
+import numpy as np
+
+from . import damped_oscillator
+
+SCATTER_MEMBERS = 5000  # largest ensemble drawn as points, larger ones are drawn as a density image
+DENSITY_BINS = 200  # bins per axis of the density image
+
+
+def wrap(angles):
+    # Angles in radians wrapped to [-pi, pi), pendulums that went over the top are back beside the others
+    return (angles + np.pi) % (2 * np.pi) - np.pi
+
+
+class Simulation(damped_oscillator.Simulation):
+    PARAMETERS: ClassVar[dict] = {
+        "members": "MEMBERS",
+        "angle_range": "ANGLE_RANGE",
+        "velocity_range": "VELOCITY_RANGE",
+        "damping": "DAMPING_CONSTANT",
+        "length": "STRING_LENGTH",
+        "gravity": "G_EARTH",
+        "mass": "BOB_MASS",
+    }
+
+    def __init__(self):
+        self.MEMBERS = 60  # pendulums along each side of the grid of starting angles and angular velocities
+        super().__init__()
+        self.name = "Phase Portrait"
+
+        self.ANGLE_RANGE = 180  # starting angles go from -ANGLE_RANGE to ANGLE_RANGE in degrees
+        self.VELOCITY_RANGE = 360  # starting angular velocities go from -VELOCITY_RANGE to VELOCITY_RANGE in deg/s
+        self.BOB_MASS = 1
+        self.DAMPING_CONSTANT = 0.5
+
+        # Every pendulum is recorded each frame, so runs are kept short and in single precision
+        self.SIM_LENGTH = 60
+        self.STORAGE = "float32"
+        self.resize()
+
+    @property
+    def POSITIONS(self):
+        return slice(0, self.MEMBERS**2)
+
+    @property
+    def VELOCITIES(self):
+        return slice(self.MEMBERS**2, 2 * self.MEMBERS**2)
+
+    @property
+    def SCHEMA(self):
+        members = range(1, self.MEMBERS**2 + 1)
+        angles = [
+            {"name": f"theta{member}", "label": f"Angular Position {member}", "unit": "rad"} for member in members
+        ]
+        velocities = [
+            {"name": f"omega{member}", "label": f"Angular Velocity {member}", "unit": "rad/s"} for member in members
+        ]
+        return angles + velocities
+
+    def state_size(self):
+        return 2 * self.MEMBERS**2
+
+    def initial_conditions(self):
+        self.resize()
+
+        angles = np.deg2rad(np.linspace(-self.ANGLE_RANGE, self.ANGLE_RANGE, self.MEMBERS))
+        velocities = np.deg2rad(np.linspace(-self.VELOCITY_RANGE, self.VELOCITY_RANGE, self.MEMBERS))
+
+        # Every angle against every velocity, all the angles of the pendulums first and then their velocities
+        state = np.concatenate([np.repeat(angles, self.MEMBERS), np.tile(velocities, self.MEMBERS)])
+
+        self.trajectory.start(state)
+
+        return state
+
+    def batch_initial_conditions(self, params, size):
+        # A whole grid per member, so members can differ in anything but how many pendulums are in the grid
+        if np.unique(params.MEMBERS).size != 1:
+            raise ValueError("Every member of a batch of phase portraits needs the same number of pendulums")
+        self.MEMBERS = int(np.unique(params.MEMBERS)[0])
+        self.resize()
+
+        angle_range = np.broadcast_to(params.ANGLE_RANGE, size)[:, None]
+        velocity_range = np.broadcast_to(params.VELOCITY_RANGE, size)[:, None]
+        grid = np.linspace(-1, 1, self.MEMBERS)
+
+        angles = np.deg2rad(angle_range * np.repeat(grid, self.MEMBERS))
+        velocities = np.deg2rad(velocity_range * np.tile(grid, self.MEMBERS))
+
+        return np.concatenate([angles, velocities], axis=1)
+
+    def pendulums(self, state):
+        # View of the state as (..., pendulums, 2) with each pendulum's angle and angular velocity together
+        return np.swapaxes(state.reshape(*np.shape(state)[:-1], 2, -1), -1, -2)
+
+    def derivatives(self, t, state, params):
+        # The same equation of motion as a single pendulum, evaluated for every pendulum at once. Parameters of a
+        # batch have one value per member, which applies to all of its pendulums
+        if np.ndim(state) > 1:
+            params = SimpleNamespace(
+                **{name: value[:, None] if np.ndim(value) else value for name, value in vars(params).items()}
+            )
+        derivatives = super().derivatives(t, self.pendulums(state), params)
+        return np.swapaxes(derivatives, -1, -2).reshape(np.shape(state))
+
+    def at_rest(self, state):
+        """Whether each pendulum is at rest, with the check the single pendulum stops at
+
+        Angles are wrapped first, so pendulums that went over the top come to rest at the bottom too.
+        """
+        pendulums = self.pendulums(state)
+        return (abs(pendulums[..., 1]) < 0.001) & (abs(wrap(pendulums[..., 0])) < 0.001)
+
+    def get_events(self) -> list:
+        # Pendulums come to rest one at a time, see advance(), so there is no event that ends the run
+        return []
+
+    def advance(self, integrator, events, t, state, dt):
+        # Pendulums at rest stay where they stopped while the rest carry on, as members of simulate_batch() do
+        stepped = integrator.step(t, state, dt)
+        resting = np.tile(self.at_rest(state), 2)
+
+        return np.where(resting, state, stepped), np.zeros(np.shape(state)[:-1], dtype=bool), []
+
+    def stopped(self, state, params):
+        return self.at_rest(state).all(axis=-1)
+
+    def get_figure(self):
+        import matplotlib.pyplot as plt
+
+        simulation = self.playback_states()
+        pendulums = len(simulation[0]) // 2
+
+        # Angles of every frame wrapped and in degrees, velocities in degrees per second
+        angles = np.rad2deg(wrap(simulation[:, :pendulums]))
+        velocities = np.rad2deg(simulation[:, pendulums:])
+
+        fig = plt.figure()
+        ax = plt.gca()
+        ax.set_xlabel("Angular Position (deg)")
+        ax.set_ylabel("Angular Velocity (deg/s)")
+
+        speed = max(float(np.max(np.abs(velocities))), 1)
+        ax.set_xlim(-180, 180)
+        ax.set_ylim(-speed, speed)
+
+        if pendulums <= SCATTER_MEMBERS:
+            # One collection for every pendulum, moved by replacing its offsets
+            points = ax.scatter(angles[0], velocities[0], s=4)
+            offsets = np.empty((pendulums, 2))
+
+            def animate_func(i):
+                offsets[:, 0] = angles[i]
+                offsets[:, 1] = velocities[i]
+                points.set_offsets(offsets)
+                return (points,)
+
+        else:
+            # Too many pendulums to draw one by one, the image is the number in each bin of phase space
+            image = ax.imshow(
+                np.zeros((DENSITY_BINS, DENSITY_BINS)),
+                extent=(-180, 180, -speed, speed),
+                origin="lower",
+                aspect="auto",
+                interpolation="nearest",
+            )
+
+            def density(i):
+                columns = np.clip(((angles[i] + 180) / 360 * DENSITY_BINS).astype(int), 0, DENSITY_BINS - 1)
+                rows = np.clip(((velocities[i] + speed) / (2 * speed) * DENSITY_BINS).astype(int), 0, DENSITY_BINS - 1)
+                counts = np.bincount(rows * DENSITY_BINS + columns, minlength=DENSITY_BINS**2)
+                return counts.reshape(DENSITY_BINS, DENSITY_BINS)
+
+            def animate_func(i):
+                counts = density(i)
+                image.set_data(counts)
+                image.set_clim(0, max(counts.max(), 1))
+                return (image,)
+
+        anim = self.animate(fig, animate_func, len(simulation))
+
+        return fig, anim
+
+    def update_variables(self, variables) -> bool:
+        self.trajectory.reset()
+        if "members" in variables:
+            self.MEMBERS = int(variables["members"])
+        if "angle_range" in variables:
+            self.ANGLE_RANGE = float(variables["angle_range"])
+        if "velocity_range" in variables:
+            self.VELOCITY_RANGE = float(variables["velocity_range"])
+
+        self.resize()
+
+        return super().update_variables(variables)
+
+    def get_fields(self) -> dict:
+        fields = {
+            "members": {"type": "integer", "value": self.MEMBERS, "label": "Pendulums per Side", "min": 1},
+            "angle_range": {
+                "type": "float",
+                "value": self.ANGLE_RANGE,
+                "label": "Range of Starting Angles",
+                "min": 0,
+            },
+            "velocity_range": {
+                "type": "float",
+                "value": self.VELOCITY_RANGE,
+                "label": "Range of Starting Angular Velocities",
+                "min": 0,
+            },
+        }
+        fields.update(super().get_fields())
+        del fields["start_angle"]
+
+        return fields
+
+    def invariants(self, states, times) -> dict:
+        # Totals over every pendulum
+        invariants = super().invariants(self.pendulums(states), times)
+        for invariant in invariants.values():
+            invariant["values"] = invariant["values"].sum(axis=-1)
+
+        return invariants
+
+    def reading_columns(self, states) -> dict:
+        # Summaries of the whole ensemble, rather than a reading per pendulum
+        resting = self.at_rest(states)
+        angles = np.rad2deg(np.abs(wrap(states[:, : states.shape[1] // 2])))
+
+        readings = {
+            "resting": {"label": "Pendulums at Rest", "unit": "", "values": resting.sum(axis=-1)},
+            "largest_angle": {"label": "Largest Angle", "unit": "deg", "values": angles.max(axis=-1)},
+            "mean_angle": {"label": "Mean Angle", "unit": "deg", "values": angles.mean(axis=-1)},
+        }
+
+        return readings
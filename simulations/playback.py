@@ -0,0 +1,53 @@
+"""Resampling of recorded states to the rate they are displayed at, and decimated paths for plotting whole runs"""
+
+import numpy as np
+
+DISPLAY_FPS = 25  # frames per second animations are played at, whatever rate the states were recorded at
+
+
+def frame_positions(length: int, states_per_frame: float) -> np.ndarray:
+    # Fractional index of the state shown by each frame, the last state is always shown so a run ends where it stopped
+    positions = np.arange(0, length - 1, states_per_frame) if length > 1 else np.zeros(1)
+    if positions[-1] < length - 1:
+        positions = np.append(positions, length - 1)
+    return positions
+
+
+def resample(states: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """States at fractional indices, linearly interpolated between the recorded states around them
+
+    Positions that are all whole numbers only pick states, e.g. every fourth when recording at four times the display
+    rate, which doesn't interpolate through the instants of collisions.
+    """
+    lower = np.floor(positions).astype(int)
+    fraction = positions - lower
+
+    if not fraction.any():
+        return states[lower]
+
+    upper = np.minimum(lower + 1, len(states) - 1)
+    fraction = fraction.reshape(-1, *([1] * (states.ndim - 1))).astype(states.dtype)
+    return states[lower] + fraction * (states[upper] - states[lower])
+
+
+def decimate(points: np.ndarray, max_points: int = 2000) -> np.ndarray:
+    """At most about max_points of a path, keeping the extremes of every coordinate
+
+    The path is split into equal runs of points and only the first and last point and the points with the smallest
+    and largest values in each run are kept, in order. Limits computed from the result are those of the whole path.
+    """
+    if len(points) <= max_points:
+        return points
+
+    runs = max(max_points // (2 + 2 * points.shape[1]), 1)
+
+    # Padded with copies of the last point so the runs are of equal size
+    size = -(-len(points) // runs)
+    padded = np.pad(points, ((0, runs * size - len(points)), (0, 0)), mode="edge").reshape(runs, size, -1)
+    starts = np.arange(runs) * size
+
+    keep = [starts, [len(points) - 1]]
+    for extreme in (np.argmin, np.argmax):
+        keep.append((starts[:, None] + extreme(padded, axis=1)).ravel())
+
+    return points[np.unique(np.minimum(np.concatenate(keep), len(points) - 1))]
@@ -0,0 +1,81 @@
+"""Discovery of the simulation modules in the simulations directory"""
+
+import ast
+import pathlib
+
+
+def parse(file: pathlib.Path):
+    try:
+        source = file.read_text(encoding="utf-8")
+    except (OSError, UnicodeDecodeError):
+        return None
+
+    # Parsing is most of the cost, so support modules are skipped by a plain text search first
+    if "class Simulation" not in source:
+        return None
+
+    try:
+        return ast.parse(source)
+    except SyntaxError:
+        return None
+
+
+def find_simulation_class(tree: ast.Module):
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and node.name == "Simulation":
+            return node
+    return None
+
+
+def is_simulation_file(file: pathlib.Path) -> bool:
+    # Simulation modules define a Simulation class, anything else in the directory is support code. The source is
+    # parsed rather than imported so nothing heavy is loaded just to list the simulations
+    tree = parse(file)
+    return tree is not None and find_simulation_class(tree) is not None
+
+
+def get_simulation_files(directory: pathlib.Path) -> list:
+    return sorted(file for file in pathlib.Path(directory).rglob("*.py") if is_simulation_file(file))
+
+
+def simulation_name(simulation_class: ast.ClassDef):
+    # The display name is the first argument of the super().__init__() call in Simulation.__init__
+    for node in simulation_class.body:
+        if isinstance(node, ast.FunctionDef) and node.name == "__init__":
+            for call in ast.walk(node):
+                if (
+                    isinstance(call, ast.Call)
+                    and isinstance(call.func, ast.Attribute)
+                    and call.func.attr == "__init__"
+                    and call.args
+                    and isinstance(call.args[0], ast.Constant)
+                    and isinstance(call.args[0].value, str)
+                ):
+                    return call.args[0].value
+    return None
+
+
+def read_metadata(file: pathlib.Path):
+    """Name, description and module of the simulation in file, or None if it doesn't define one
+
+    Only the source is parsed, so this is cheap enough to run on every simulation at startup. Simulations whose name
+    isn't a plain string fall back to one made from the file name.
+    """
+    file = pathlib.Path(file)
+    tree = parse(file)
+    simulation_class = None if tree is None else find_simulation_class(tree)
+    if simulation_class is None:
+        return None
+
+    return {
+        "module": file.stem,
+        "file": file,
+        "name": simulation_name(simulation_class) or file.stem.replace("_", " ").title(),
+        "description": (ast.get_docstring(tree) or "").strip(),
+    }
+
+
+def get_simulations(directory: pathlib.Path) -> list:
+    # Metadata of every simulation, sorted by file like get_simulation_files()
+    simulations = (read_metadata(file) for file in sorted(pathlib.Path(directory).rglob("*.py")))
+    return [metadata for metadata in simulations if metadata is not None]
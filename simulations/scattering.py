@@ -1,12 +1,41 @@
 """Simulation of scattering a particle off another particle"""
 
+from typing import ClassVar
+
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib import animation
-from .simulation import BaseSimulation  # type: ignore
+
+from .simulation import BaseSimulation, Event  # type: ignore
 
 
 class Simulation(BaseSimulation):
+    PARAMETERS: ClassVar[dict] = {
+        "r1": "MOVING_PARTICLE_RADIUS",
+        "r2": "STATIC_PARTICLE_RADIUS",
+        "b": "IMPACT_PARAMETER",
+        "speed": "LAUNCH_SPEED",
+        "mass1": "MOVING_PARTICLE_MASS",
+        "mass2": "STATIC_PARTICLE_MASS",
+    }
+    # Only act from the first contact on
+    DEPENDENCIES: ClassVar[dict] = {
+        "MOVING_PARTICLE_RADIUS": "events",
+        "STATIC_PARTICLE_RADIUS": "events",
+        "MOVING_PARTICLE_MASS": "events",
+        "STATIC_PARTICLE_MASS": "events",
+    }
+    POSITIONS: ClassVar[list] = [0, 1, 4, 5]
+    VELOCITIES: ClassVar[list] = [2, 3, 6, 7]
+    SCHEMA: ClassVar[list] = [
+        {"name": "x1", "label": "X Position of Moving Particle", "unit": "m"},
+        {"name": "y1", "label": "Y Position of Moving Particle", "unit": "m"},
+        {"name": "vx1", "label": "X Velocity of Moving Particle", "unit": "m/s"},
+        {"name": "vy1", "label": "Y Velocity of Moving Particle", "unit": "m/s"},
+        {"name": "x2", "label": "X Position of Static Particle", "unit": "m"},
+        {"name": "y2", "label": "Y Position of Static Particle", "unit": "m"},
+        {"name": "vx2", "label": "X Velocity of Static Particle", "unit": "m/s"},
+        {"name": "vy2", "label": "Y Velocity of Static Particle", "unit": "m/s"},
+    ]
+
     def __init__(self):
         super().__init__("Scattering", 8)
 
@@ -18,7 +47,7 @@ class Simulation(BaseSimulation):
         self.MOVING_PARTICLE_MASS = 1  # mass of the moving particle in kg
         self.STATIC_PARTICLE_MASS = 2  # mass of the static particle in kg
 
-        self.state = np.zeros((1, self.state_length))  # x1, y1, x2, y2, vx1, vy1, vx2, vy2
+        self.INTEGRATOR = "explicit_euler"  # exact for the free flight between collisions
 
     def initial_conditions(self):
         state = np.zeros(self.state_length)
@@ -32,59 +61,65 @@ class Simulation(BaseSimulation):
         state[6] = 0  # x velocity of the static particle
         state[7] = 0  # y velocity of the static particle
 
-        self.state[0] = state
+        self.trajectory.start(state)
+
+        return state
+
+    def axis_size(self, params=None):
+        if params is None:
+            params = self
+        return np.maximum(params.LAUNCH_SPEED * 4, params.IMPACT_PARAMETER * 1.25)
+
+    def batch_initial_conditions(self, params, size):
+        state = np.zeros((size, self.state_length))
+
+        state[:, 0] = -params.LAUNCH_SPEED * 3
+        state[:, 1] = params.IMPACT_PARAMETER
+        state[:, 2] = params.LAUNCH_SPEED
+
+        return state
+
+    def derivatives(self, t, state, params):
+        derivatives = np.zeros_like(state)
+
+        derivatives[..., self.POSITIONS] = state[..., self.VELOCITIES]
+
+        return derivatives
+
+    def separation(self, t, state, params):
+        return np.sqrt((state[..., 0] - state[..., 4]) ** 2 + (state[..., 1] - state[..., 5]) ** 2) - (
+            params.MOVING_PARTICLE_RADIUS + params.STATIC_PARTICLE_RADIUS
+        )
+
+    def collide(self, state, params):
+        theta = np.arctan2(params.IMPACT_PARAMETER, params.MOVING_PARTICLE_RADIUS + params.STATIC_PARTICLE_RADIUS)
+
+        state[..., 2] = np.where(
+            theta < np.pi / 4, -params.LAUNCH_SPEED * np.cos(theta), params.LAUNCH_SPEED * np.cos(theta)
+        )
+        state[..., 3] = params.LAUNCH_SPEED * np.sin(theta)
+
+        state[..., 6] = (params.MOVING_PARTICLE_MASS / params.STATIC_PARTICLE_MASS) * abs(state[..., 2])
+        state[..., 7] = -(params.MOVING_PARTICLE_MASS / params.STATIC_PARTICLE_MASS) * state[..., 3]
 
         return state
 
-    def axis_size(self):
-        return max(self.LAUNCH_SPEED * 4, self.IMPACT_PARAMETER * 1.25)
-
-    def simulate(self, initial_state):
-        state = np.copy(initial_state)
-        simulation = [np.copy(state)]
-
-        for i in range(self.SIM_LENGTH * self.SIMS_PER_SECOND):
-            state[0] += state[2] / self.SIMS_PER_SECOND
-            state[1] += state[3] / self.SIMS_PER_SECOND
-            state[2] = state[2]
-            state[3] = state[3]
-
-            state[4] += state[6] / self.SIMS_PER_SECOND
-            state[5] += state[7] / self.SIMS_PER_SECOND
-            state[6] = state[6]
-            state[7] = state[7]
-
-            if (
-                np.sqrt((state[0] - state[4]) ** 2 + (state[1] - state[5]) ** 2)
-                < self.MOVING_PARTICLE_RADIUS + self.STATIC_PARTICLE_RADIUS
-            ):
-                theta = np.arctan2(self.IMPACT_PARAMETER, self.MOVING_PARTICLE_RADIUS + self.STATIC_PARTICLE_RADIUS)
-                if theta < np.pi / 4:
-                    state[2] = -self.LAUNCH_SPEED * np.cos(theta)
-                else:
-                    state[2] = self.LAUNCH_SPEED * np.cos(theta)
-                state[3] = self.LAUNCH_SPEED * np.sin(theta)
-
-                state[6] = (self.MOVING_PARTICLE_MASS / self.STATIC_PARTICLE_MASS) * abs(state[2])
-                state[7] = -(self.MOVING_PARTICLE_MASS / self.STATIC_PARTICLE_MASS) * state[3]
-
-            if (
-                abs(state[0]) > self.axis_size()
-                or abs(state[1]) > self.axis_size()
-                or abs(state[4]) > self.axis_size()
-                or abs(state[5]) > self.axis_size()
-            ):
-                break
-            if i > self.MAX_SIMS:
-                break
-
-            simulation.append(np.copy(state))
-            self.state = np.vstack([self.state, state])
-
-        return np.array(simulation)
+    def get_events(self) -> list:
+        return [Event("contact", self.separation, direction=-1, action=self.collide)]
+
+    def stopped(self, state, params):
+        axis_size = self.axis_size(params)
+        return (
+            (abs(state[..., 0]) > axis_size)
+            | (abs(state[..., 1]) > axis_size)
+            | (abs(state[..., 4]) > axis_size)
+            | (abs(state[..., 5]) > axis_size)
+        )
 
     def get_figure(self):
-        simulation = self.simulate(self.initial_conditions())
+        import matplotlib.pyplot as plt
+
+        simulation = self.playback_states()
 
         fig = plt.figure()
 
@@ -99,24 +134,24 @@ class Simulation(BaseSimulation):
         static_particle = plt.Circle((self.state[0, 4], self.state[0, 5]), self.STATIC_PARTICLE_RADIUS)
         ax.add_patch(static_particle)
 
+        # Views of the centres of every frame, slicing doesn't copy the trajectory
+        moving_centres = simulation[:, 0:2]
+        static_centres = simulation[:, 4:6]
+
         def animate_func(i):
-            self.offset = i
-            data = simulation[:, [0, 1]]
-            moving_particle.center = (data[i, 0], data[i, 1])
-            static_particle.center = (simulation[i, 4], simulation[i, 5])
+            moving_particle.center = moving_centres[i]
+            static_particle.center = static_centres[i]
 
             return moving_particle, static_particle
 
-        anim = animation.FuncAnimation(
-            fig, animate_func, frames=range(len(simulation)), interval=(1000 / self.SIMS_PER_SECOND)
-        )
+        anim = self.animate(fig, animate_func, len(simulation))
 
         ax.set_aspect("equal")
 
         return fig, anim
 
     def update_variables(self, variables) -> bool:
-        self.state = np.zeros((1, self.state_length))
+        self.trajectory.reset()
         if "r1" in variables:
             self.MOVING_PARTICLE_RADIUS = float(variables["r1"])
         if "r2" in variables:
@@ -163,25 +198,37 @@ class Simulation(BaseSimulation):
 
         return fields
 
-    def get_readings(self) -> dict:
-        try:
-            state = self.state[self.offset]
-        except IndexError:
-            state = self.state[-1]
-
-        readings = {
-            "x1": {"label": "X Position of Moving Particle", "value": round(state[0], self.ROUND)},
-            "y1": {"label": "Y Position of Moving Particle", "value": round(state[1], self.ROUND)},
-            "vx1": {"label": "X Velocity of Moving Particle", "value": round(state[2], self.ROUND)},
-            "vy1": {"label": "Y Velocity of Moving Particle", "value": round(state[3], self.ROUND)},
-            "theta": {
-                "label": "Angle of Scattering",
-                "value": round(np.rad2deg(np.arctan2(state[3], state[2])), self.ROUND),
+    def invariants(self, states, times) -> dict:
+        masses = [self.MOVING_PARTICLE_MASS, self.STATIC_PARTICLE_MASS]
+        momentum_x = masses[0] * states[..., 2] + masses[1] * states[..., 6]
+        momentum_y = masses[0] * states[..., 3] + masses[1] * states[..., 7]
+        energy = 0.5 * masses[0] * (states[..., 2] ** 2 + states[..., 3] ** 2)
+        energy = energy + 0.5 * masses[1] * (states[..., 6] ** 2 + states[..., 7] ** 2)
+
+        # Components are measured against the size of the total momentum, the y component starts at zero
+        momentum = float(np.hypot(momentum_x[0], momentum_y[0])) if len(states) else 0
+
+        # collide() balances the y momentum but sets the x velocities from the angle of contact alone, so the x momentum
+        # and the energy change at the collision, see cross_section.collide() for an elastic one
+        return {
+            "momentum_x": {"label": "X Momentum", "unit": "kg m/s", "values": momentum_x, "conserved": False},
+            "momentum_y": {
+                "label": "Y Momentum",
+                "unit": "kg m/s",
+                "values": momentum_y,
+                "conserved": True,
+                "scale": momentum,
             },
-            "x2": {"label": "X Position of Static Particle", "value": round(state[4], self.ROUND)},
-            "y2": {"label": "Y Position of Static Particle", "value": round(state[5], self.ROUND)},
-            "vx2": {"label": "X Velocity of Static Particle", "value": round(state[6], self.ROUND)},
-            "vy2": {"label": "Y Velocity of Static Particle", "value": round(state[7], self.ROUND)},
+            "energy": {"label": "Kinetic Energy", "unit": "J", "values": energy, "conserved": False},
         }
 
+    def reading_columns(self, states) -> dict:
+        columns = super().reading_columns(states)
+        angle = np.rad2deg(np.arctan2(states[:, 3], states[:, 2]))
+
+        # The angle of scattering is shown after the moving particle's entries
+        readings = {key: columns[key] for key in ("x1", "y1", "vx1", "vy1")}
+        readings["theta"] = {"label": "Angle of Scattering", "unit": "deg", "values": angle}
+        readings.update({key: columns[key] for key in ("x2", "y2", "vx2", "vy2")})
+
         return readings
@@ -1,7 +1,327 @@
 from abc import ABC, abstractmethod
+from functools import partial
+from time import perf_counter
+from types import SimpleNamespace
+from typing import ClassVar
+
+import numpy as np
+
+from . import checkpoint as checkpoints
+from . import playback, storage
+from .cache import TrajectoryCache, canonical
+from .instrumentation import profiler
+
+STREAM_CHUNK = 1024  # states per block yielded by BaseSimulation.stream()
+STREAM_BYTES = 64 * 2**20  # largest block yielded by BaseSimulation.stream(), fewer states for long states
+
+
+def cumulative_integral(values, times) -> np.ndarray:
+    # Trapezoidal integral of values over times from the first state to each one, along the first axis
+    steps = np.diff(times).reshape(-1, *([1] * (np.ndim(values) - 1)))
+    areas = 0.5 * steps * (values[1:] + values[:-1])
+    return np.concatenate([np.zeros_like(values[:1]), np.cumsum(areas, axis=0)])
+
+
+def relative_drift(invariant: dict) -> np.ndarray:
+    # Change of an invariant from its first value, relative to its scale or to the first value when it has none
+    values = np.asarray(invariant["values"], dtype=float)
+    scale = abs(invariant.get("scale", values[0] if len(values) else 0))
+    return (values - values[:1]) / (scale if scale > 0 else 1)
+
+
+class Trajectory:
+    """Preallocated store for the states of a simulation run
+
+    Rows are written into a buffer that doubles in size when full and is trimmed to the number of recorded states
+    once the run ends, so a run of n steps costs O(n) copying instead of the O(n^2) of repeated stacking.
+    """
+
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, state_shape, dtype=np.float64):
+        # Shape of one recorded row, the state length or (members, state length) for batches
+        self.row_shape = (state_shape,) if isinstance(state_shape, int) else tuple(state_shape)
+        self.dtype = np.dtype(dtype)
+        self.reset()
+
+    def reset(self) -> None:
+        # A single row of zeros stands in for the state until a run starts
+        self.buffer = np.zeros((1, *self.row_shape), dtype=self.dtype)
+        self.length = 1
+
+    def start(self, initial_state, capacity: int = INITIAL_CAPACITY) -> None:
+        self.buffer = np.empty((max(capacity, 1), *self.row_shape), dtype=self.dtype)
+        self.buffer[0] = initial_state
+        self.length = 1
+
+    def append(self, state) -> None:
+        if self.length == len(self.buffer):
+            grown = np.empty((len(self.buffer) * 2, *self.row_shape), dtype=self.dtype)
+            grown[: self.length] = self.buffer[: self.length]
+            self.buffer = grown
+
+        self.buffer[self.length] = state
+        self.length += 1
+
+    def clear(self, capacity: int = INITIAL_CAPACITY, dtype=None) -> None:
+        # Empties the store for a run whose states all arrive through extend()
+        if dtype is not None:
+            self.dtype = np.dtype(dtype)
+        self.buffer = np.empty((max(capacity, 1), *self.row_shape), dtype=self.dtype)
+        self.length = 0
+
+    def extend(self, states) -> None:
+        end = self.length + len(states)
+        if end > len(self.buffer):
+            grown = np.empty((max(end, len(self.buffer) * 2), *self.row_shape), dtype=self.dtype)
+            grown[: self.length] = self.buffer[: self.length]
+            self.buffer = grown
+
+        self.buffer[self.length : end] = states
+        self.length = end
+
+    def fill(self, states) -> None:
+        # Takes over states computed all at once, such as from a closed form solution
+        self.buffer = states
+        self.length = len(states)
+
+    def finish(self) -> np.ndarray:
+        if self.length != len(self.buffer):
+            self.buffer = self.buffer[: self.length].copy()
+
+        return self.buffer
+
+    @property
+    def data(self) -> np.ndarray:
+        return self.buffer[: self.length]
+
+    def __len__(self) -> int:
+        return self.length
+
+
+def join_blocks(blocks: list) -> np.ndarray:
+    """Concatenates blocks of rows, emptying the list
+
+    Each block is freed once it is copied, and the pages of the result are only taken as they are written, so the
+    memory used stays close to the size of the result instead of twice it.
+    """
+    joined = np.empty((sum(len(block) for block in blocks), *blocks[0].shape[1:]), dtype=blocks[0].dtype)
+
+    start = 0
+    while blocks:
+        block = blocks.pop(0)
+        joined[start : start + len(block)] = block
+        start += len(block)
+
+    return joined
+
+
+class Integrator(ABC):
+    """Advances the state of a simulation by a step of dt using its derivatives()
+
+    The second order schemes assume the derivative of each entry of the simulation's POSITIONS is the matching entry
+    of its VELOCITIES. States may be a single state or a batch of states along the leading axes, in which case t and dt
+    may also hold one value per state with a trailing axis of length one.
+    """
+
+    def __init__(self, simulation, params):
+        self.simulation = simulation
+        self.params = params
+
+    def derivatives(self, t, state):
+        return self.simulation.derivatives(t, state, self.params)
+
+    @abstractmethod
+    def step(self, t, state, dt):
+        pass
+
+
+class ExplicitEuler(Integrator):
+    def step(self, t, state, dt):
+        return state + dt * self.derivatives(t, state)
+
+
+class SemiImplicitEuler(Integrator):
+    def step(self, t, state, dt):
+        positions, velocities = self.simulation.POSITIONS, self.simulation.VELOCITIES
+
+        # Velocities are updated first and the positions are moved with the new velocities
+        state = state.copy()
+        state[..., velocities] += dt * self.derivatives(t, state)[..., velocities]
+        state[..., positions] += dt * state[..., velocities]
+
+        return state
+
+
+class VelocityVerlet(Integrator):
+    def step(self, t, state, dt):
+        positions, velocities = self.simulation.POSITIONS, self.simulation.VELOCITIES
+
+        acceleration = self.derivatives(t, state)[..., velocities]
+
+        state = state.copy()
+        state[..., positions] += dt * state[..., velocities] + 0.5 * dt**2 * acceleration
+        state[..., velocities] += 0.5 * dt * acceleration
+
+        # Velocity dependent forces are evaluated at the half step velocity
+        state[..., velocities] += 0.5 * dt * self.derivatives(t + dt, state)[..., velocities]
+
+        return state
+
+
+class RungeKutta4(Integrator):
+    def step(self, t, state, dt):
+        k1 = self.derivatives(t, state)
+        k2 = self.derivatives(t + dt / 2, state + dt / 2 * k1)
+        k3 = self.derivatives(t + dt / 2, state + dt / 2 * k2)
+        k4 = self.derivatives(t + dt, state + dt * k3)
+
+        return state + dt / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+
+
+class AdaptiveIntegrator(Integrator):
+    """Steps one of the scipy.integrate solvers behind solve_ivp and samples it every dt
+
+    The solver keeps its own step size across calls and is only restarted when the state it is given is not the one
+    it returned, e.g. after a collision changed the velocities.
+    """
+
+    RTOL = 1e-6
+    ATOL = 1e-9
+
+    def __init__(self, simulation, params, method: str = "RK45"):
+        super().__init__(simulation, params)
+
+        from scipy import integrate
+
+        self.solver_class = getattr(integrate, method)
+        self.solver = None
+        self.expected = None
+
+    def step(self, t, state, dt):
+        # A single solver can't stop at a different time for each state of a batch, which only happens for the
+        # remainder of a step after an event so a fixed RK4 step is accurate enough there
+        if np.ndim(dt):
+            return RungeKutta4.step(self, t, state, dt)
+
+        if self.solver is None or not np.array_equal(state, self.expected):
+            shape = np.shape(state)
+            self.solver = self.solver_class(
+                lambda t, y: self.derivatives(t, y.reshape(shape)).ravel(),
+                t,
+                np.ravel(state),
+                np.inf,
+                rtol=self.RTOL,
+                atol=self.ATOL,
+            )
+
+        while self.solver.t < t + dt:
+            message = self.solver.step()
+            if self.solver.status == "failed":
+                raise RuntimeError(message)
+
+        self.expected = self.solver.dense_output()(t + dt).reshape(np.shape(state))
+
+        return self.expected.copy()
+
+
+INTEGRATORS = {
+    "explicit_euler": ExplicitEuler,
+    "semi_implicit_euler": SemiImplicitEuler,
+    "velocity_verlet": VelocityVerlet,
+    "rk4": RungeKutta4,
+    "rk45": partial(AdaptiveIntegrator, method="RK45"),
+    "dop853": partial(AdaptiveIntegrator, method="DOP853"),
+    "lsoda": partial(AdaptiveIntegrator, method="LSODA"),
+}
+
+
+class Event:
+    """Zero crossing of function(t, state, params) located to within a small fraction of a step
+
+    direction is -1 for crossings from positive to negative, 1 for the reverse and 0 for both. Terminal events end the
+    run at the crossing, otherwise action(state, params) is applied there, e.g. to resolve a collision, and the rest of
+    the step is integrated from the new state.
+    """
+
+    ITERATIONS = 40  # bisection steps, locates events to within 2^-40 of a step
+
+    def __init__(self, name: str, function, direction: int = 0, terminal: bool = False, action=None):
+        self.name = name
+        self.function = function
+        self.direction = direction
+        self.terminal = terminal
+        self.action = action
+
+    def crossed(self, before, after):
+        falling = (before >= 0) & (after < 0)
+        rising = (before <= 0) & (after > 0)
+
+        if self.direction < 0:
+            return falling
+        if self.direction > 0:
+            return rising
+        return falling | rising
+
+    def locate(self, simulation, params, t, state, stepped, dt):
+        """Returns the fraction of the step at which the event happens and the state there
+
+        The state within the step is a cubic Hermite interpolation between both ends, which is exact for the free flight
+        and constant forces of most of the simulations.
+        """
+        start = simulation.derivatives(t, state, params)
+        end = simulation.derivatives(t + dt, stepped, params)
+
+        def interpolate(fraction):
+            u = fraction[..., None]
+            return (
+                (2 * u**3 - 3 * u**2 + 1) * state
+                + (u**3 - 2 * u**2 + u) * dt * start
+                + (-2 * u**3 + 3 * u**2) * stepped
+                + (u**3 - u**2) * dt * end
+            )
+
+        before = self.function(t, state, params)
+        low = np.zeros(np.shape(before))
+        high = np.ones(np.shape(before))
+
+        # The high end always lies past the crossing, so an action taken there can't trigger the event again
+        for _ in range(self.ITERATIONS):
+            middle = (low + high) / 2
+            crossed = self.crossed(before, self.function(t + middle * dt, interpolate(middle), params))
+            high = np.where(crossed, middle, high)
+            low = np.where(crossed, low, middle)
+
+        return high, interpolate(high)
+
+
+class SimulationCancelled(Exception):
+    pass
 
 
 class BaseSimulation(ABC):
+    PARAMETERS: ClassVar[dict] = {}  # field from get_fields() -> attribute it sets
+
+    # How attributes act on a run, those not listed may change every state after the first. "events" ones only act
+    # through get_events() and stopped(), so runs differing in them share their states up to the first event either
+    # has, see reuse_prefix(). "display" ones only change get_figure() and aren't part of the run at all.
+    DEPENDENCIES: ClassVar[dict] = {}
+
+    cache = TrajectoryCache()  # shared by every simulation, runs with the same parameters are only simulated once
+
+    # Indices of the state whose derivatives are the velocities, used by the second order integrators
+    POSITIONS: ClassVar[list] = []
+    VELOCITIES: ClassVar[list] = []
+
+    # Entries of the state in order, as {"name", "label", "unit"} and optionally the "resolution" they are quantized
+    # to, which is 10^-(ROUND + 1) otherwise. Names the columns of exports and gives the default readings.
+    SCHEMA: ClassVar[list] = []
+
+    # Whether many parameter sets can be advanced together by simulate_batch(), which needs a
+    # batch_initial_conditions(params, size) giving the initial states of size members stacked as (size, state_length)
+    # from the arrays of batch_parameters(), and derivatives(), stopped() and advance() that work on a stack of states
+    SUPPORTS_BATCH = True
+
     def __init__(self, name: str, state_length: int):
         self.name = name
         self.offset = 0
@@ -15,18 +335,628 @@ class BaseSimulation(ABC):
         self.ROUND = 5  # number of decimal places to round to
         self.MAX_SIMS = 50000  # maximum number of simulations to run
 
+        self.INTEGRATOR = "rk4"  # name of the integrator in INTEGRATORS used by simulate()
+        self.ANALYTIC = True  # whether to use the closed form solution of configurations that have one
+        self.STORAGE = "float64"  # how recorded states are kept, one of storage.STORAGES, integration is float64
+
+        self.trajectory = Trajectory(state_length)
+        self.events: list = []  # events of the last run, see simulate()
+        self.cancel_requested = False  # set from another thread to stop a run with SimulationCancelled
+        self.checkpoint = None  # where the last run got to, to resume or extend it, see stream()
+
+        self.display_fps = playback.DISPLAY_FPS  # frames per second of animations, independent of SIMS_PER_SECOND
+        self.frame = 0  # animation frame last shown
+        self.frame_indices = np.zeros(1, dtype=int)  # index of the state nearest to each frame, see playback_states()
+        self.frame_callback = None  # called with self.offset after each animation frame, e.g. to show readings
+        self.start_frame = 0  # frame the next animation starts from, its repeats start from the beginning
+        self.preview = None  # states of a run still being simulated elsewhere, see playback_states()
+        self.readings_cache = None  # see readings_table()
+
+    @property
+    def state(self) -> np.ndarray:
+        # Recorded states of the last run, shares memory with the array returned by simulate()
+        return self.trajectory.data
+
+    def state_size(self) -> int:
+        # Length of a state under the current attributes, for simulations whose state grows with them
+        return self.state_length
+
+    def resize(self):
+        # Matches the state length to state_size(), called wherever those attributes may have changed as clone()
+        # sets them without update_variables()
+        if self.state_length != self.state_size():
+            self.state_length = self.state_size()
+            self.trajectory = type(self.trajectory)(self.state_length)
+
     @abstractmethod
     def initial_conditions(self):
         pass
 
     @abstractmethod
-    def simulate(self, initial_state):
+    def derivatives(self, t, state, params):
+        # Time derivative of state, params is either the simulation itself or batch_parameters()
         pass
 
+    def get_events(self) -> list:
+        # Events located exactly within a step, such as impacts and collisions
+        return []
+
+    def stopped(self, state, params):
+        # Conditions only checked at the end of each step, such as leaving the axes
+        return np.zeros(np.shape(state)[:-1], dtype=bool)
+
+    def integrator(self, name=None, params=None) -> Integrator:
+        name = name or self.INTEGRATOR
+        if name not in INTEGRATORS:
+            raise ValueError(f"Unknown integrator {name!r}, expected one of {', '.join(INTEGRATORS)}")
+
+        return INTEGRATORS[name](self, self if params is None else params)
+
+    def advance(self, integrator, events, t, state, dt):
+        """Steps state from t to t + dt, handling the events crossed on the way
+
+        Returns the new state, whether a terminal event stopped it there and the events that happened as
+        (event, happened, time, state) tuples, with one value per state for batches.
+        """
+        stepped = integrator.step(t, state, dt)
+        stopped = np.zeros(np.shape(state)[:-1], dtype=bool)
+        happened = []
+
+        for event in events:
+            crossed = event.crossed(
+                event.function(t, state, integrator.params), event.function(t + dt, stepped, integrator.params)
+            )
+            if not crossed.any():
+                continue
+
+            if np.ndim(crossed):
+                # Only the members of a batch that crossed are searched, the rest finish the step as they are
+                members = np.flatnonzero(crossed)
+                fraction = np.ones(len(crossed))
+                event_state = stepped.copy()
+                fraction[members], event_state[members] = event.locate(
+                    self, self.select_members(integrator.params, members), t, state[members], stepped[members], dt
+                )
+            else:
+                fraction, event_state = event.locate(self, integrator.params, t, state, stepped, dt)
+
+            happened.append((event, crossed, t + fraction * dt, event_state))
+
+            if event.terminal:
+                stepped = np.where(crossed[..., None], event_state, stepped)
+                stopped |= crossed
+            else:
+                # Batches need the time and length of the rest of the step per state, broadcast over the state axis
+                remainder = (1 - fraction) * dt
+                event_time = t + fraction * dt
+                if np.ndim(remainder):
+                    remainder, event_time = remainder[:, None], event_time[:, None]
+
+                rest = integrator.step(event_time, event.action(event_state, integrator.params), remainder)
+                stepped = np.where(crossed[..., None], rest, stepped)
+
+        return stepped, stopped, happened
+
+    def exact_solution(self, initial_state, params):
+        """Closed form solution when the configuration has one, otherwise None
+
+        Returns a function giving the states at an array of times, shaped (times, members) for batches, and the name
+        and time of the terminal event that ends the run or None.
+        """
+        return
+
+    def frame_count(self) -> int:
+        # Number of states recorded by a run that no event or check stops early
+        return 1 + min(self.SIM_LENGTH * self.SIMS_PER_SECOND, self.MAX_SIMS + 1)
+
+    def sample_exact(self, solution, params, size: int = 1):
+        """Evaluates a closed form solution at the times simulate() records states, in one go
+
+        Returns the states shaped (times, members, state_length) and padded with NaN, the number of states of each
+        member and the events in the form of self.batch_events.
+        """
+        states_at, event = solution
+        lengths = np.full(size, self.frame_count())
+        events = {}
+
+        if event is not None:
+            name, end = event
+            end = np.broadcast_to(end, size)
+
+            # Runs stop on the first frame past the event, recording the state at the event in its place
+            before = np.maximum(np.ceil(end * self.SIMS_PER_SECOND).astype(int), 1)
+            ended = before < lengths
+            lengths = np.where(ended, before + 1, lengths)
+
+        frames = np.arange(lengths.max())[:, None]
+        times = np.repeat(frames / self.SIMS_PER_SECOND, size, axis=1)
+        if event is not None:
+            times[before[ended], np.flatnonzero(ended)] = end[ended]
+        times[frames >= lengths] = np.nan
+
+        states = states_at(times)
+
+        # Frames that fail the end of step checks aren't recorded, as when integrating
+        stopped = self.stopped(states, params)
+        stopped[0] = False
+        lengths = np.where(stopped.any(axis=0), stopped.argmax(axis=0), lengths)
+        states[frames >= lengths] = np.nan
+
+        if event is not None:
+            happened = ended & (lengths == before + 1)
+            event_states = np.full((size, self.state_length), np.nan)
+            event_states[happened] = states[before[happened], np.flatnonzero(happened)]
+            events[name] = {"time": np.where(happened, end, np.nan), "state": event_states}
+
+        return states, lengths, events
+
+    def simulate(self, initial_state, integrator=None):
+        """Simulates from initial_state, recording a state every 1 / SIMS_PER_SECOND seconds
+
+        A run ended by a terminal event records the state at the event as its last state. Every event that happened is
+        listed in self.events with its exact time and state. Without an integrator given, configurations with a closed
+        form solution are sampled from it instead of integrated.
+
+        Runs are cached on their parameters, so the states returned are read only and may be shared with earlier runs.
+        """
+        for states in self.simulate_progressively(initial_state, integrator):
+            pass
+
+        return states
+
+    def simulate_progressively(
+        self, initial_state, integrator=None, chunk_size: int = STREAM_CHUNK, chunk_seconds=None
+    ):
+        """simulate() as a generator, yielding the states recorded so far every chunk_size states
+
+        With chunk_seconds the states are also yielded whenever that long has passed since the last time, see stream().
+        The states so far are views into self.trajectory, only valid until the next one is yielded. The last array
+        yielded is the whole run, as simulate() returns it. A cached run is yielded at once.
+        """
+        with profiler.span("simulate", simulation=self.name):
+            key = self.cache.key(self, initial_state, integrator)
+            cached = self.cache.get(key)
+
+            if cached is not None:
+                stored, events, self.checkpoint = cached
+                self.trajectory.fill(storage.unpack(stored))
+                self.events = list(events)
+                profiler.count("cache_hits")
+                yield self.trajectory.finish()
+                return
+
+            self.trajectory.clear(dtype=self.state_dtype())
+            related = self.cache.key(self, initial_state, integrator, self.parameters_depending_on("events"))
+
+            resume = self.reuse_prefix(related, initial_state, integrator)
+            if resume is not None:
+                yield self.trajectory.data
+
+            for chunk in self.stream(initial_state, integrator, chunk_size, resume, chunk_seconds):
+                self.trajectory.extend(chunk)
+                yield self.trajectory.data
+
+            states = self.trajectory.finish()
+            self.cache.put(key, storage.pack(states, self.STORAGE, self.resolution()), self.events, self.checkpoint)
+            with self.cache.lock:
+                self.cache.related[related] = key
+
+            profiler.count("steps", len(states) - 1)
+
+        yield states
+
+    def run(self, initial_state, integrator=None):
+        # simulate() without the cache
+        self.trajectory.clear(dtype=self.state_dtype())
+        for chunk in self.stream(initial_state, integrator):
+            self.trajectory.extend(chunk)
+
+        return self.trajectory.finish()
+
+    def stream(self, initial_state, integrator=None, chunk_size: int = STREAM_CHUNK, resume=None, chunk_seconds=None):
+        """Simulates like run(), yielding the states in consecutive blocks of at most chunk_size rows and STREAM_BYTES
+
+        Nothing is kept besides the block being filled, so callers that write the blocks out and drop them simulate
+        runs of any length in bounded memory. Events are added to self.events as they happen. Blocks are of
+        state_dtype(), while the state is integrated in float64.
+
+        Before each block is yielded self.checkpoint is set to where the run got to after it. Given as resume, a
+        checkpoint continues its run with the states after the ones already recorded, initial_state is then ignored.
+        Adaptive integrators start their step size control afresh when resuming.
+
+        With chunk_seconds a block is also yielded once that long has passed since the last one, however few rows it
+        has, so slow simulations show progress soon after they start.
+        """
+        recorded = 0
+        if resume is not None:
+            checkpoints.check(self, resume, integrator)
+            initial_state = np.array(resume["initial_state"])
+            recorded = resume["rows"]
+
+        state = np.copy(initial_state)
+        dtype = self.state_dtype()
+        chunk_size = max(min(chunk_size, STREAM_BYTES // (self.state_length * dtype.itemsize)), 1)
+        self.events = []
+
+        solution = self.exact_solution(state, self) if integrator is None and self.ANALYTIC else None
+        if solution is not None:
+            # Sampling a closed form solution is cheap, so resumed runs sample it again and skip what was recorded
+            states, lengths, events = self.sample_exact(solution, self)
+
+            for name, event in events.items():
+                if not np.isnan(event["time"][0]):
+                    self.events.append({"name": name, "time": float(event["time"][0]), "state": event["state"][0]})
+
+            finished = bool(lengths[0] < self.frame_count())
+            for start in range(recorded, lengths[0], chunk_size):
+                end = min(start + chunk_size, lengths[0])
+                self.checkpoint = self.make_checkpoint(initial_state, integrator, end - 1, end, states[end - 1, 0])
+                self.checkpoint["finished"] = finished and end == lengths[0]
+                yield states[start:end, 0].astype(dtype, copy=False)
+            return
+
+        integrator_name = integrator
+        integrator = self.integrator(integrator)
+        events = self.get_events()
+        dt = 1 / self.SIMS_PER_SECOND
+
+        chunk = np.empty((chunk_size, self.state_length), dtype=dtype)
+        first_step = 0
+        finished = False
+
+        if resume is None:
+            chunk[0] = state
+            length = 1
+        else:
+            state = np.array(resume["state"])
+            self.events = [dict(event) for event in resume["events"]]
+            first_step = resume["step"]
+            finished = resume["finished"]
+            length = 0
+
+        step = first_step
+        last_yield = perf_counter()
+        for i in range(first_step, self.SIM_LENGTH * self.SIMS_PER_SECOND):
+            if finished:
+                break
+            if self.cancel_requested:
+                raise SimulationCancelled()
+
+            # A new block for every yield, so callers are free to keep the ones they were given
+            overdue = chunk_seconds is not None and length and perf_counter() - last_yield > chunk_seconds
+            if length == chunk_size or overdue:
+                recorded += length
+                self.checkpoint = self.make_checkpoint(initial_state, integrator_name, i, recorded, state)
+                yield chunk[:length]
+                chunk = np.empty((chunk_size, self.state_length), dtype=dtype)
+                length = 0
+                last_yield = perf_counter()
+
+            state, stopped, happened = self.advance(integrator, events, i * dt, state, dt)
+            step = i + 1
+
+            for event, _, time, event_state in happened:
+                self.events.append({"name": event.name, "time": float(time), "state": event_state})
+
+            # The state at a terminal event is recorded, a state that left the simulation's bounds isn't
+            finished = bool(stopped or self.stopped(state, self))
+            ended = finished or i > self.MAX_SIMS
+            if stopped or not ended:
+                chunk[length] = state
+                length += 1
+            if ended:
+                break
+
+        self.checkpoint = self.make_checkpoint(initial_state, integrator_name, step, recorded + length, state)
+        self.checkpoint["finished"] = finished
+        if length:
+            yield chunk[:length]
+
+    def parameters_depending_on(self, dependency: str) -> set:
+        return {name for name, depends in self.DEPENDENCIES.items() if depends == dependency}
+
+    def reuse_prefix(self, related: str, initial_state, integrator=None):
+        """Starts a run with the states it shares with the latest cached run differing only in "events" parameters
+
+        Both runs integrate the same equations, so they have the same states until either has an event or a check
+        stops it. Those are put in self.trajectory and the checkpoint to continue from is returned, or None when there
+        is no such run or nothing to reuse. Only float64 runs of fixed step integrators are reused, as their states
+        are exactly where integration continues from.
+        """
+        if not self.parameters_depending_on("events") or self.STORAGE != "float64":
+            return None
+        if integrator is None and self.ANALYTIC and self.exact_solution(initial_state, self) is not None:
+            return None  # sampled rather than integrated, which is already cheap
+        if isinstance(self.integrator(integrator), AdaptiveIntegrator):
+            return None
+
+        with self.cache.lock:
+            other = self.cache.related.get(related)
+        cached = None if other is None else self.cache.get(other)
+        if cached is None or not isinstance(cached[0], np.ndarray):
+            return None
+
+        states, events, _ = cached
+        times = np.arange(len(states)) / self.SIMS_PER_SECOND
+
+        # Index of the first step each run could differ on, a step i goes from states[i] to states[i + 1]
+        limits = [len(states) - 1]
+        if events:
+            # One step earlier than the one the event fell in, in case it landed right on a step boundary
+            limits.append(max(int(np.ceil(events[0]["time"] * self.SIMS_PER_SECOND)) - 2, 0))
+        for event in self.get_events():
+            values = event.function(times, states, self)
+            limits.extend(np.flatnonzero(event.crossed(values[:-1], values[1:]))[:1])
+        limits.extend(np.flatnonzero(self.stopped(states[1:], self))[:1])
+
+        shared = int(min(limits))
+        if shared == 0:
+            return None
+
+        profiler.count("reused_steps", shared)
+        self.trajectory.extend(states[: shared + 1])
+        self.events = []
+        return self.make_checkpoint(initial_state, integrator, shared, shared + 1, states[shared])
+
+    def make_checkpoint(self, initial_state, integrator, step: int, rows: int, state) -> dict:
+        # See checkpoint.py, step is the next step to take from state and rows the number of states recorded so far
+        return {
+            "simulation": f"{type(self).__module__}.{type(self).__qualname__}",
+            "parameters": self.parameter_values(),
+            "integrator": integrator,
+            "initial_state": np.asarray(initial_state, dtype=float).tolist(),
+            "step": int(step),
+            "rows": int(rows),
+            "state": np.asarray(state, dtype=float).tolist(),
+            "events": list(self.events),
+            "finished": False,
+        }
+
+    def extend(self, seconds: int, integrator=None) -> np.ndarray:
+        """Continues the last run for seconds more, appending the new states to self.trajectory
+
+        SIM_LENGTH and MAX_SIMS are raised to fit and the longer run is cached like simulate() would. A run that ended
+        at a terminal event or left the simulation's bounds can't go any further and is returned as it is.
+        """
+        if self.checkpoint is None:
+            raise ValueError(f"{self.name} has no run to extend")
+
+        resume = self.checkpoint
+        checkpoints.check(self, resume, integrator)
+
+        self.SIM_LENGTH += seconds
+        self.MAX_SIMS += seconds * self.SIMS_PER_SECOND
+
+        if not resume["finished"]:
+            # The recorded states may be read only and shared with the cache, extend() copies them into a new buffer
+            for chunk in self.stream(None, integrator, resume=resume):
+                self.trajectory.extend(chunk)
+
+        states = self.trajectory.finish()
+        key = self.cache.key(self, np.array(resume["initial_state"]), integrator)
+        self.cache.put(key, storage.pack(states, self.STORAGE, self.resolution()), self.events, self.checkpoint)
+
+        return states
+
+    def parameter_values(self) -> dict:
+        # Every uppercase attribute, which are the parameters of a run, in a form that compares equal across types
+        return {name: canonical(value) for name, value in vars(self).items() if name.isupper()}
+
+    def clone(self):
+        # New simulation with the same parameters and its own trajectory, e.g. to run on another thread
+        clone = type(self)()
+        for name, value in vars(self).items():
+            if name.isupper():
+                setattr(clone, name, value)
+        return clone
+
+    def state_times(self) -> np.ndarray:
+        # Time of each recorded state, the last one is at the terminal event if one ended the run
+        times = np.arange(len(self.state)) / self.SIMS_PER_SECOND
+
+        if self.terminal_time() is not None:
+            times[-1] = self.terminal_time()
+
+        return times
+
+    def terminal_time(self):
+        # Time of the terminal event that ended the last run, or None
+        terminal = {event.name for event in self.get_events() if event.terminal}
+        for event in self.events:
+            if event["name"] in terminal:
+                return event["time"]
+        return None
+
+    def column_names(self) -> list:
+        return [column["name"] for column in self.SCHEMA] or [f"state{index}" for index in range(self.state_length)]
+
+    def schema(self) -> list:
+        # SCHEMA with the dtype the states are recorded as
+        dtype = self.state_dtype().str
+        return [{"unit": "", **column, "dtype": dtype} for column in self.SCHEMA]
+
+    def state_dtype(self) -> np.dtype:
+        return storage.state_dtype(self.STORAGE)
+
+    def resolution(self) -> np.ndarray:
+        # Step each entry of the state is rounded to by quantized storage
+        default = 10.0 ** -(self.ROUND + 1)
+        if not self.SCHEMA:
+            return np.full(self.state_length, default)
+        return np.array([column.get("resolution", default) for column in self.SCHEMA])
+
+    def batch_parameters(self, param_arrays: dict):
+        for field in param_arrays:
+            if field not in self.PARAMETERS:
+                raise ValueError(f"{self.name} has no parameter {field!r}")
+
+        arrays = np.broadcast_arrays(*(np.asarray(value, dtype=float) for value in param_arrays.values()))
+        size = arrays[0].size if arrays else 1
+
+        # Parameters that are not swept keep their current scalar value and broadcast against the swept ones
+        params = {name: value for name, value in vars(self).items() if name.isupper()}
+        for field, array in zip(param_arrays, arrays):
+            params[self.PARAMETERS[field]] = array.ravel()
+
+        return SimpleNamespace(**params), size
+
+    def select_members(self, params, members):
+        # Parameters of only some members of a batch, scalars are shared by all of them
+        return SimpleNamespace(
+            **{name: value[members] if np.ndim(value) else value for name, value in vars(params).items()}
+        )
+
+    def simulate_batch(self, param_arrays: dict, integrator=None):
+        """Simulates every combination of the broadcast parameter arrays at once
+
+        param_arrays maps fields of get_fields() to arrays, members are taken in the flattened order of their
+        broadcast shape. Returns the states padded with NaN to shape (members, steps, state_length), as a view of an
+        array shaped (steps, members, state_length), and the number of recorded states of each member. The time and
+        state of the first occurrence of each event per member are kept in self.batch_events, NaN for members where
+        it didn't happen. Simulations without SUPPORTS_BATCH raise ValueError.
+
+        Every member is kept for as many steps as the longest one, 8 bytes per entry, so a batch costs about
+        members * steps * state_length * 8 bytes at its peak, plus STREAM_BYTES for the block being recorded. Grids
+        too large for that can be split into several batches, or run through sweep.record_sweep().
+        """
+        if not self.SUPPORTS_BATCH:
+            raise ValueError(f"{self.name} can't be simulated as a batch, simulate each parameter set instead")
+
+        params, size = self.batch_parameters(param_arrays)
+        state = self.batch_initial_conditions(params, size)
+
+        solution = self.exact_solution(state, params) if integrator is None and self.ANALYTIC else None
+        if solution is not None:
+            states, lengths, self.batch_events = self.sample_exact(solution, params, size)
+            return np.swapaxes(states, 0, 1), lengths
+
+        active = np.ones(size, dtype=bool)
+        lengths = np.ones(size, dtype=int)
+
+        # Recorded in fixed blocks of steps instead of a buffer that doubles, which held up to three times the states
+        # while growing and trimming, and copied once into the output when the run ends, see join_blocks()
+        block_steps = max(STREAM_BYTES // (size * self.state_length * 8), 1)
+        blocks = []
+        block = np.empty((block_steps, size, self.state_length))
+        block[0] = state
+        row = 1
+
+        integrator = self.integrator(integrator, params)
+        events = self.get_events()
+        dt = 1 / self.SIMS_PER_SECOND
+
+        self.batch_events = {
+            event.name: {"time": np.full(size, np.nan), "state": np.full((size, self.state_length), np.nan)}
+            for event in events
+        }
+
+        for i in range(self.SIM_LENGTH * self.SIMS_PER_SECOND):
+            stepped, stopped, happened = self.advance(integrator, events, i * dt, state, dt)
+
+            for event, crossed, time, event_state in happened:
+                record = self.batch_events[event.name]
+                first = crossed & active & np.isnan(record["time"])
+                record["time"][first] = time[first]
+                record["state"][first] = event_state[first]
+
+            # Members stopped by an event still record the state at the event, those stopped by a check don't
+            ending = active & stopped
+            active &= ~stopped & ~self.stopped(stepped, params)
+            recorded = active | ending
+            if not recorded.any():
+                break
+            if i > self.MAX_SIMS:
+                break
+
+            # Members that stop keep their last state so they can't overflow while the rest carry on
+            state = np.where(recorded[:, None], stepped, state)
+            if row == block_steps:
+                blocks.append(block)
+                block = np.empty((block_steps, size, self.state_length))
+                row = 0
+            block[row] = np.where(recorded[:, None], state, np.nan)
+            row += 1
+            lengths += recorded
+
+        blocks.append(block[:row])
+        del block
+        return np.swapaxes(join_blocks(blocks), 0, 1), lengths
+
     @abstractmethod
     def get_figure(self):
+        # matplotlib is imported in here rather than at the top of simulation modules so it isn't loaded headless
         pass
 
+    def animate(self, fig, animate_func, frames: int):
+        # frames are those of playback_states(), self.offset is set to the state each one shows
+        from matplotlib import animation
+
+        interval = 1 / self.display_fps
+        last_frame = None
+        start = min(self.start_frame, frames - 1)
+
+        def frame_numbers():
+            nonlocal start
+            yield from range(start, frames)
+            start = 0
+
+        def frame_func(i):
+            nonlocal last_frame
+            self.frame = i
+            self.offset = int(self.frame_indices[min(i, len(self.frame_indices) - 1)])
+
+            if not profiler.enabled:
+                artists = animate_func(i)
+            else:
+                # A frame late by more than half an interval means the timer skipped one or more frames
+                now = perf_counter()
+                if last_frame is not None and now - last_frame > 1.5 * interval:
+                    profiler.count("dropped_frames", round((now - last_frame) / interval) - 1)
+                last_frame = now
+
+                profiler.count("frames")
+                with profiler.span("frame", simulation=self.name, frame=i):
+                    artists = animate_func(i)
+
+            if self.frame_callback is not None:
+                self.frame_callback(self.offset)
+
+            return artists
+
+        # With blitting only the artists animate_func returns are redrawn each frame, on top of a saved background,
+        # so the axes must not change while playing and animate_func should only index precomputed arrays
+        return animation.FuncAnimation(
+            fig,
+            frame_func,
+            frames=frame_numbers,
+            save_count=frames,
+            cache_frame_data=False,
+            interval=1000 * interval,
+            blit=True,
+        )
+
+    def playback_states(self):
+        """States for get_figure() to animate, one per frame at display_fps, normally from the whole simulated run
+
+        States recorded faster than display_fps are picked or interpolated, so raising SIMS_PER_SECOND makes runs more
+        accurate without slowing down their playback. While self.preview is set, those states are played instead, so
+        the start of a long run can be shown while the rest is still being simulated on another thread.
+        """
+        if self.preview is not None:
+            self.trajectory.fill(self.preview)
+            states = self.preview
+        else:
+            states = self.simulate(self.initial_conditions())
+
+        states_per_frame = self.SIMS_PER_SECOND / self.display_fps
+        if states_per_frame == 1:
+            self.frame_indices = np.arange(len(states))
+            return states
+
+        positions = playback.frame_positions(len(states), states_per_frame)
+        self.frame_indices = np.round(positions).astype(int)
+        return playback.resample(states, positions)
+
     @abstractmethod
     def update_variables(self, variables) -> bool:
         pass
@@ -35,6 +965,65 @@ class BaseSimulation(ABC):
     def get_fields(self) -> dict:
         pass
 
-    @abstractmethod
+    def reading_columns(self, states) -> dict:
+        # Readings of every state at once, as {key: {"label", "unit", "values": one value per state}}, by default the
+        # entries of the state as described by SCHEMA
+        return {
+            column["name"]: {"label": column["label"], "unit": column.get("unit", ""), "values": states[:, index]}
+            for index, column in enumerate(self.SCHEMA)
+        }
+
+    def invariants(self, states, times) -> dict:
+        """Conserved and dissipated quantities of every state at once, none by default
+
+        Returned as {key: {"label", "unit", "values", "conserved"}} like reading_columns(). Quantities marked conserved
+        only change through integration error, so their drift measures it, see drift(). They may give a "scale" to
+        measure the drift against instead of their starting value, e.g. the size of the total momentum for one of its
+        components that starts at zero. times are those of the states, for integrating the power dissipated.
+        """
+        return {}
+
+    def drift(self, states=None, times=None) -> dict:
+        # Largest relative change of each conserved quantity over a run, the last one by default
+        if states is None:
+            states, times = self.state, self.state_times()
+
+        return {
+            key: float(np.nanmax(np.abs(relative_drift(invariant)), initial=0))
+            for key, invariant in self.invariants(states, times).items()
+            if invariant["conserved"]
+        }
+
+    def readings_table(self):
+        """Keys, labels, units and rounded values of the readings of every recorded state
+
+        The values are an array with a row per state, computed once per trajectory so showing the readings of a frame
+        is only indexing.
+        """
+        buffer, length = self.trajectory.buffer, len(self.trajectory)
+
+        # The buffer is kept in the cache, so a new trajectory can't reuse its identity
+        if self.readings_cache is None or self.readings_cache[0] is not buffer or self.readings_cache[1] != length:
+            columns = self.reading_columns(self.state)
+            for key, invariant in self.invariants(self.state, self.state_times()).items():
+                columns[key] = invariant
+                if invariant["conserved"]:
+                    label = f"{invariant['label']} Drift"
+                    columns[f"{key}_drift"] = {"label": label, "unit": "%", "values": 100 * relative_drift(invariant)}
+
+            values = np.column_stack([np.broadcast_to(column["values"], length) for column in columns.values()])
+            values = values.astype(float)  # rounded in float64, so float32 states still show as few digits
+            labels = [column["label"] for column in columns.values()]
+            units = [column.get("unit", "") for column in columns.values()]
+            self.readings_cache = (buffer, length, list(columns), labels, units, np.round(values, self.ROUND))
+
+        return self.readings_cache[2:]
+
     def get_readings(self) -> dict:
-        pass
+        # Readings of the state at self.offset, or of the last state once the animation has gone past the end
+        keys, labels, units, values = self.readings_table()
+        row = values[min(self.offset, len(values) - 1)].tolist()
+        return {
+            key: {"label": label, "unit": unit, "value": value}
+            for key, label, unit, value in zip(keys, labels, units, row)
+        }
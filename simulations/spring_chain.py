@@ -0,0 +1,324 @@
+"""Simulation of a chain of masses connected by springs, hanging from a fixed point or lying along a table"""
+
+from functools import lru_cache
+from typing import ClassVar
+
+import numpy as np
+
+from .simulation import BaseSimulation, Integrator  # type: ignore
+
+MODAL_MASSES = 2000  # longest chain solved exactly through its normal modes, longer chains are integrated
+
+
+def stiffness_product(positions):
+    """A @ positions for the stiffness matrix A of the chain, without forming A
+
+    A is tridiagonal with 2 on the diagonal, apart from a 1 for the last mass which has no spring below it, and -1
+    either side of it. Works along the last axis, so batches of chains are multiplied at once.
+    """
+    product = 2 * positions
+    product[..., :-1] -= positions[..., 1:]
+    product[..., 1:] -= positions[..., :-1]
+    product[..., -1] -= positions[..., -1]
+    return product
+
+
+@lru_cache(maxsize=4)
+def normal_modes(masses: int):
+    """Eigenvalues and orthonormal eigenvectors of the stiffness matrix, as columns
+
+    A chain fixed at the top and free at the bottom has modes sin(i theta) with theta = (2j - 1) pi / (2N + 1) and
+    eigenvalues 4 sin^2(theta / 2), so they are written down rather than computed, and cached as they only depend on
+    the number of masses.
+    """
+    angles = (2 * np.arange(1, masses + 1) - 1) * np.pi / (2 * masses + 1)
+    modes = np.sin(np.outer(np.arange(1, masses + 1), angles)) * np.sqrt(4 / (2 * masses + 1))
+    modes.setflags(write=False)
+    return 4 * np.sin(angles / 2) ** 2, modes
+
+
+@lru_cache(maxsize=4)
+def midpoint_factor(masses: int, coupling: float):
+    # Banded Cholesky factor of I + coupling A, in the upper form of scipy.linalg.cholesky_banded()
+    from scipy.linalg import cholesky_banded
+
+    bands = np.zeros((2, masses))
+    bands[0, 1:] = -coupling
+    bands[1] = 1 + 2 * coupling
+    bands[1, -1] = 1 + coupling
+    return cholesky_banded(bands)
+
+
+class ImplicitMidpoint(Integrator):
+    """Implicit midpoint rule for the linear chain, stable for any step however stiff the springs are
+
+    Eliminating the new velocities leaves a tridiagonal system for the new positions, solved with a Cholesky factor
+    that is computed once per chain and step size. Energy is conserved for every step size, although the fastest
+    modes are slowed down when the step is long compared to their period.
+    """
+
+    def step(self, t, state, dt):
+        from scipy.linalg import cho_solve_banded
+
+        params = self.params
+        if np.ndim(params.SPRING_CONSTANT) or np.ndim(params.BOB_MASS):
+            raise ValueError("implicit_midpoint needs the same spring constant and mass for every member of a batch")
+
+        masses = self.simulation.MASSES
+        coupling = dt**2 / 4 * params.SPRING_CONSTANT / params.BOB_MASS
+        positions, velocities = state[..., :masses], state[..., masses:]
+
+        # Constant part of the acceleration, from gravity and the free end
+        forcing = self.simulation.derivatives(t, np.zeros(np.shape(state)), params)[..., masses:]
+
+        right = positions + dt * velocities - coupling * stiffness_product(positions) + dt**2 / 2 * forcing
+        factor = midpoint_factor(masses, float(coupling))
+        stepped_positions = cho_solve_banded((factor, False), np.moveaxis(right, -1, 0)).T.reshape(right.shape)
+
+        stepped = np.empty_like(state)
+        stepped[..., :masses] = stepped_positions
+        stepped[..., masses:] = 2 * (stepped_positions - positions) / dt - velocities
+
+        return stepped
+
+
+class Simulation(BaseSimulation):
+    PARAMETERS: ClassVar[dict] = {
+        "masses": "MASSES",
+        "gravity": "G_EARTH",
+        "spring_length": "SPRING_LENGTH",
+        "bob_mass": "BOB_MASS",
+        "spring_constant": "SPRING_CONSTANT",
+        "horizontal": "HORIZONTAL",
+        "displacement": "DISPLACEMENT",
+    }
+
+    def __init__(self):
+        self.MASSES = 20  # number of masses in the chain
+        super().__init__("Spring Chain", 2 * self.MASSES)  # positions of every mass, then their velocities
+
+        self.BOB_MASS = 1  # mass of each bob in kg
+        self.SPRING_CONSTANT = 10  # spring constant of each spring in N/m
+        self.SPRING_LENGTH = 1  # natural length of each spring in m
+        self.HORIZONTAL = False  # whether the chain lies along a table, where gravity doesn't stretch it
+        self.DISPLACEMENT = 0  # how far the first mass is pulled along the chain at the start in m
+
+        self.SIM_LENGTH = 60
+        self.INTEGRATOR = "velocity_verlet"
+
+    @property
+    def POSITIONS(self):
+        return slice(0, self.MASSES)
+
+    @property
+    def VELOCITIES(self):
+        return slice(self.MASSES, 2 * self.MASSES)
+
+    @property
+    def SCHEMA(self):
+        positions = [
+            {"name": f"y{mass}", "label": f"Position of Bob {mass}", "unit": "m"} for mass in range(1, self.MASSES + 1)
+        ]
+        velocities = [
+            {"name": f"vy{mass}", "label": f"Velocity of Bob {mass}", "unit": "m/s"}
+            for mass in range(1, self.MASSES + 1)
+        ]
+        return positions + velocities
+
+    def integrator(self, name=None, params=None):
+        if (name or self.INTEGRATOR) == "implicit_midpoint":
+            return ImplicitMidpoint(self, self if params is None else params)
+        return super().integrator(name, params)
+
+    def state_size(self):
+        return 2 * self.MASSES
+
+    def initial_conditions(self):
+        self.resize()
+        state = np.zeros(self.state_length)
+
+        # Every spring starts at its natural length, with the first mass pulled along the chain
+        state[: self.MASSES] = np.arange(1, self.MASSES + 1) * self.SPRING_LENGTH
+        state[0] += self.DISPLACEMENT
+
+        self.trajectory.start(state)
+
+        return state
+
+    def batch_initial_conditions(self, params, size):
+        state = np.zeros((size, self.state_length))
+
+        state[:, : self.MASSES] = np.arange(1, self.MASSES + 1) * np.reshape(params.SPRING_LENGTH, (-1, 1))
+        state[:, 0] += params.DISPLACEMENT
+
+        return state
+
+    def gravity(self, params):
+        # Gravity along the chain, none when it lies flat
+        return params.G_EARTH * (1 - np.asarray(params.HORIZONTAL, dtype=float))
+
+    def derivatives(self, t, state, params):
+        masses = self.MASSES
+        derivatives = np.empty_like(state)
+
+        # Parameters get a trailing axis to broadcast along the chain, one value per member for batches
+        rate = np.asarray(params.SPRING_CONSTANT / params.BOB_MASS)[..., None]
+        gravity = np.asarray(self.gravity(params))[..., None]
+
+        derivatives[..., :masses] = state[..., masses:]
+        derivatives[..., masses:] = gravity - rate * stiffness_product(state[..., :masses])
+
+        # The last spring pulls the bottom mass up to its natural length below the one above it
+        derivatives[..., -1:] += rate * np.asarray(params.SPRING_LENGTH)[..., None]
+
+        return derivatives
+
+    def equilibrium(self, params):
+        # Each spring is stretched by the weight of the masses below it
+        stretch = np.reshape(self.gravity(params) * params.BOB_MASS / params.SPRING_CONSTANT, (-1, 1))
+        bob = np.arange(1, self.MASSES + 1)
+        below = bob * (self.MASSES + 1) - bob * (bob + 1) / 2  # total number of masses below the springs above each bob
+        return bob * np.reshape(params.SPRING_LENGTH, (-1, 1)) + stretch * below
+
+    def exact_solution(self, initial_state, params):
+        # The equations are linear, so the motion about the equilibrium is a sum of the normal modes of
+        # y'' = -(k / m) A y, projected on and off the cached eigenvectors of A
+        if self.MASSES > MODAL_MASSES:
+            return None
+
+        eigenvalues, modes = normal_modes(self.MASSES)
+        frequencies = np.sqrt(np.reshape(params.SPRING_CONSTANT / params.BOB_MASS, (-1, 1)) * eigenvalues)
+        equilibrium = self.equilibrium(params)
+        if initial_state.ndim == 1:
+            frequencies, equilibrium = frequencies[0], equilibrium[0]
+
+        amplitudes = (initial_state[..., : self.MASSES] - equilibrium) @ modes
+        rates = initial_state[..., self.MASSES :] @ modes
+
+        def states_at(t):
+            phases = frequencies * t[..., None]
+            cosines, sines = np.cos(phases), np.sin(phases)
+
+            coordinates = amplitudes * cosines + rates / frequencies * sines
+            speeds = rates * cosines - amplitudes * frequencies * sines
+
+            return np.concatenate([equilibrium + coordinates @ modes.T, speeds @ modes.T], axis=-1)
+
+        return states_at, None
+
+    def invariants(self, states, times) -> dict:
+        positions, velocities = states[..., : self.MASSES], states[..., self.MASSES :]
+
+        # Stretch of every spring, the first hangs from the fixed point at 0
+        stretches = np.diff(positions, axis=-1, prepend=0) - self.SPRING_LENGTH
+        springs = 0.5 * self.SPRING_CONSTANT * (stretches.astype(float) ** 2).sum(axis=-1)
+        kinetic = 0.5 * self.BOB_MASS * (velocities.astype(float) ** 2).sum(axis=-1)
+        gravity = -self.BOB_MASS * self.gravity(self) * positions.sum(axis=-1, dtype=float)
+
+        return {
+            "spring_energy": {"label": "Spring Potential Energy", "unit": "J", "values": springs, "conserved": False},
+            "energy": {"label": "Total Energy", "unit": "J", "values": kinetic + springs + gravity, "conserved": True},
+        }
+
+    def stopped(self, state, params):
+        return np.abs(state[..., : self.MASSES]).max(axis=-1) > self.axis_size() * 10
+
+    def axis_size(self):
+        # Furthest the bottom mass reaches when let go from rest with the springs at their natural length
+        stretch = self.gravity(self) * self.BOB_MASS / self.SPRING_CONSTANT
+        reach = self.SPRING_LENGTH * (self.MASSES + 1) + stretch * self.MASSES * (self.MASSES + 1)
+        return reach + abs(self.DISPLACEMENT)
+
+    def get_figure(self):
+        import matplotlib.pyplot as plt
+
+        simulation = self.playback_states()
+        positions = simulation[:, : self.MASSES]
+
+        fig = plt.figure()
+        ax = plt.gca()
+
+        # The whole chain is one line from the fixed point through every mass, marked while they are few enough
+        # to tell apart
+        marker = "o" if self.MASSES <= 50 else None
+        (chain,) = ax.plot([], [], lw=1.5, marker=marker, markersize=8)
+
+        along = np.zeros(self.MASSES + 1)
+        across = np.zeros(self.MASSES + 1)
+        extent = max(float(np.max(positions)), self.axis_size())
+
+        if self.HORIZONTAL:
+            ax.set_xlim(0, extent)
+            ax.set_ylim(-extent / 2, extent / 2)
+            chain.set_data(along, across)
+            set_along = chain.set_xdata
+        else:
+            ax.set_xlim(-extent / 2, extent / 2)
+            ax.set_ylim(extent, 0)
+            chain.set_data(across, along)
+            set_along = chain.set_ydata
+
+        def animate_func(i):
+            along[1:] = positions[i]
+            set_along(along)
+            return (chain,)
+
+        anim = self.animate(fig, animate_func, len(simulation))
+
+        return fig, anim
+
+    def update_variables(self, variables) -> bool:
+        self.trajectory.reset()
+        if "masses" in variables:
+            self.MASSES = int(variables["masses"])
+        if "gravity" in variables:
+            self.G_EARTH = float(variables["gravity"])
+        if "spring_length" in variables:
+            self.SPRING_LENGTH = float(variables["spring_length"])
+        if "bob_mass" in variables:
+            self.BOB_MASS = float(variables["bob_mass"])
+        if "spring_constant" in variables:
+            self.SPRING_CONSTANT = float(variables["spring_constant"])
+        if "horizontal" in variables:
+            self.HORIZONTAL = variables["horizontal"]
+        if "displacement" in variables:
+            self.DISPLACEMENT = float(variables["displacement"])
+
+        self.resize()
+
+        return True
+
+    def get_fields(self) -> dict:
+        fields = {
+            "masses": {"type": "integer", "value": self.MASSES, "label": "Number of Masses", "min": 1},
+            "gravity": {"type": "float", "value": self.G_EARTH, "label": "Acceleration due to Gravity", "min": 1},
+            "spring_length": {"type": "float", "value": self.SPRING_LENGTH, "label": "Length of Spring", "min": 0.001},
+            "bob_mass": {"type": "float", "value": self.BOB_MASS, "label": "Mass of Bob", "min": 0.001},
+            "spring_constant": {
+                "type": "float",
+                "value": self.SPRING_CONSTANT,
+                "label": "Spring Constant of Spring",
+                "min": 0.001,
+            },
+            "horizontal": {"type": "checkbox", "value": self.HORIZONTAL, "label": "Horizontal"},
+            "displacement": {
+                "type": "float",
+                "value": self.DISPLACEMENT,
+                "label": "Displacement of First Bob",
+                "min": -self.SPRING_LENGTH,
+            },
+        }
+
+        return fields
+
+    def reading_columns(self, states) -> dict:
+        # The ends of the chain, rather than a reading per mass, which are the same bob when there is only one
+        masses = self.MASSES
+        readings = {
+            "top": {"label": "Position of Top Bob", "unit": "m", "values": states[:, 0]},
+            "top_velocity": {"label": "Velocity of Top Bob", "unit": "m/s", "values": states[:, masses]},
+            "bottom": {"label": "Position of Bottom Bob", "unit": "m", "values": states[:, masses - 1]},
+            "bottom_velocity": {"label": "Velocity of Bottom Bob", "unit": "m/s", "values": states[:, -1]},
+        }
+
+        return readings
@@ -0,0 +1,108 @@
+"""Compact storage of recorded trajectories
+
+Simulations always integrate in float64, their STORAGE attribute picks how the recorded states are kept:
+
+    float64     as integrated
+    float32     half the memory, about 7 significant digits
+    quantized   float32 while played, QuantizedStates in the cache, usually a quarter of the memory or less
+"""
+
+import numpy as np
+
+STORAGES = ["float64", "float32", "quantized"]
+
+
+def state_dtype(storage: str) -> np.dtype:
+    # dtype of the recorded states, quantized runs are decoded to float32 to be played
+    if storage not in STORAGES:
+        raise ValueError(f"Unknown storage {storage!r}, expected one of {', '.join(STORAGES)}")
+
+    return np.dtype(np.float64 if storage == "float64" else np.float32)
+
+
+def smallest_integer(values: np.ndarray) -> np.dtype:
+    largest = int(np.abs(values).max()) if len(values) else 0
+    for dtype in (np.int8, np.int16, np.int32):
+        if largest <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+class QuantizedStates:
+    """States rounded to a fixed resolution per column, kept as differences between consecutive states
+
+    Each column keeps its first or second differences, whichever fit the smaller integer type, so smoothly changing
+    columns take one or two bytes per state. Decoded states are within half a resolution step of the recorded ones.
+    """
+
+    def __init__(self, length: int, heads: np.ndarray, resolution: np.ndarray, deltas: list):
+        self.length = length
+        self.heads = heads  # per column the first state and first difference in steps of resolution
+        self.resolution = resolution
+        self.deltas = deltas  # per column its first or second differences, after the ones in heads
+
+    @classmethod
+    def encode(cls, states: np.ndarray, resolution):
+        resolution = np.broadcast_to(np.asarray(resolution, dtype=float), states.shape[1:]).copy()
+        steps = np.round(states / resolution).astype(np.int64)
+        first = np.diff(steps, axis=0)
+
+        heads = np.zeros((states.shape[1], 2), dtype=np.int64)
+        heads[:, 0] = steps[0]
+        deltas = []
+
+        for index, column in enumerate(first.T):
+            second = np.diff(column)
+            if len(column) > 1 and smallest_integer(second).itemsize < smallest_integer(column).itemsize:
+                heads[index, 1] = column[0]
+                deltas.append(second.astype(smallest_integer(second)))
+            else:
+                deltas.append(column.astype(smallest_integer(column)))
+
+        return cls(len(states), heads, resolution, deltas)
+
+    def decode(self, dtype=np.float32) -> np.ndarray:
+        steps = np.empty((len(self), len(self.heads)), dtype=np.int64)
+        steps[0] = self.heads[:, 0]
+
+        for index, column in enumerate(self.deltas):
+            if len(column) < len(self) - 1:  # second differences
+                column = np.cumsum(np.concatenate(([self.heads[index, 1]], column)))
+            np.cumsum(column, out=steps[1:, index])
+            steps[1:, index] += self.heads[index, 0]
+
+        return (steps * self.resolution).astype(dtype)
+
+    @property
+    def nbytes(self) -> int:
+        return self.heads.nbytes + self.resolution.nbytes + sum(column.nbytes for column in self.deltas)
+
+    def arrays(self) -> dict:
+        # For np.savez, read back with from_arrays()
+        arrays = {"length": self.length, "heads": self.heads, "resolution": self.resolution}
+        arrays.update({f"delta{index}": column for index, column in enumerate(self.deltas)})
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, data):
+        heads = data["heads"]
+        deltas = [data[f"delta{index}"] for index in range(len(heads))]
+        return cls(int(data["length"]), heads, data["resolution"], deltas)
+
+    def __len__(self) -> int:
+        return self.length
+
+
+def pack(states: np.ndarray, storage: str, resolution):
+    # Form of the states kept in the cache, quantized runs that don't compress stay float32 arrays
+    if storage == "quantized" and len(states):
+        encoded = QuantizedStates.encode(states, resolution)
+        if encoded.nbytes < states.nbytes:
+            return encoded
+    return states
+
+
+def unpack(stored) -> np.ndarray:
+    if isinstance(stored, QuantizedStates):
+        return stored.decode()
+    return stored
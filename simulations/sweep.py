@@ -0,0 +1,199 @@
+"""Parallel parameter sweeps over a pool of processes
+
+Each parameter set is given to update_variables() of a new Simulation, which is then run with simulate(), so any module
+in this directory can be swept:
+
+    with run_sweep("object_off_slope", [{"launch_angle": angle} for angle in range(90)]) as result:
+        landing = [result[i][-1] for i in range(len(result))]
+
+Parameter sets are handed out in chunks to amortise the cost of talking to the workers. Each worker writes the states
+of its chunk straight into a shared memory block, so only the block's name and the shapes are sent back instead of
+pickled arrays.
+
+Sweeps too large for memory can be recorded to trajectory files instead, one per parameter set, with record_sweep().
+"""
+
+import importlib
+import math
+import os
+import pathlib
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from .trajectory_file import record
+
+
+def create_block(size: int) -> shared_memory.SharedMemory:
+    # Blocks made by a worker have to outlive it, so the worker's resource tracker must not remove them when it exits
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(create=True, size=size, track=False)
+
+    block = shared_memory.SharedMemory(create=True, size=size)
+    resource_tracker.unregister(block._name, "shared_memory")  # type: ignore[attr-defined]
+    return block
+
+
+def run_chunk(name: str, parameter_sets: list, integrator=None, cache_directory=None):
+    module = importlib.import_module(f"{__package__}.{name}")
+    if cache_directory is not None:
+        module.Simulation.cache.directory = pathlib.Path(cache_directory)
+
+    results = []
+    events = []
+    for variables in parameter_sets:
+        simulation = module.Simulation()
+        simulation.update_variables(variables)
+        results.append(simulation.simulate(simulation.initial_conditions(), integrator))
+        events.append(simulation.events)
+
+    # Each parameter set can have its own state length, as the size of some simulations is one of their parameters
+    shapes = [states.shape for states in results]
+    dtype = np.result_type(*results)
+
+    block = create_block(max(sum(math.prod(shape) for shape in shapes) * dtype.itemsize, 1))
+    states = np.ndarray(sum(math.prod(shape) for shape in shapes), dtype=dtype, buffer=block.buf)
+    np.concatenate([result.ravel() for result in results], out=states)
+    del states
+    block.close()
+
+    # The parent process unlinks the block once it is done with the results
+    return block.name, shapes, dtype.str, events
+
+
+class SweepResult:
+    """States of every parameter set of a sweep, read from the shared memory blocks the workers wrote
+
+    Indexing gives the states of one parameter set as a view into its block. Blocks are freed by close(), or on leaving
+    a with statement, after which those views must no longer be used.
+    """
+
+    def __init__(self):
+        self.blocks = []
+        self.views = []
+        self.events = []
+
+    def add_chunk(self, block_name: str, shapes: list, dtype: str, events: list) -> None:
+        block = shared_memory.SharedMemory(name=block_name)
+        self.blocks.append(block)
+
+        sizes = [math.prod(shape) for shape in shapes]
+        states = np.ndarray(sum(sizes), dtype=dtype, buffer=block.buf)
+        for start, size, shape in zip(np.cumsum([0] + sizes), sizes, shapes):
+            self.views.append(states[start : start + size].reshape(shape))
+        self.events.extend(events)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.array([len(states) for states in self.views])
+
+    def padded(self) -> np.ndarray:
+        # Copies the states into one array shaped (parameter sets, steps, state_length), padded with NaN, where the
+        # state_length is the longest of any parameter set
+        state_length = max(view.shape[1] for view in self.views)
+        states = np.full((len(self.views), self.lengths.max(), state_length), np.nan, dtype=self.views[0].dtype)
+        for i, view in enumerate(self.views):
+            states[i, : len(view), : view.shape[1]] = view
+        return states
+
+    def close(self) -> None:
+        self.views = []
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __len__(self) -> int:
+        return len(self.views)
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        return self.views[index]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def run_sweep(
+    name: str, parameter_sets: list, workers=None, chunk_size=None, integrator=None, cache_directory=None
+) -> SweepResult:
+    """Simulates every parameter set of the simulation module name across a pool of processes
+
+    The results come back in the order of parameter_sets. chunk_size defaults to about four chunks per worker. With a
+    cache_directory the workers share the on disk tier of the trajectory cache, so repeated sweeps are only looked up.
+    """
+    parameter_sets = list(parameter_sets)
+    workers = workers or os.cpu_count() or 1
+    chunk_size = chunk_size or max(1, math.ceil(len(parameter_sets) / (workers * 4)))
+
+    result = SweepResult()
+
+    futures = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    run_chunk, name, parameter_sets[start : start + chunk_size], integrator, cache_directory
+                )
+                for start in range(0, len(parameter_sets), chunk_size)
+            ]
+
+            try:
+                for future in futures:
+                    result.add_chunk(*future.result())
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+    except BaseException:
+        # Blocks of the chunks that finished would otherwise outlive the sweep
+        attached = {block.name for block in result.blocks}
+        for future in futures:
+            finished = future.done() and not future.cancelled() and future.exception() is None
+            if finished and future.result()[0] not in attached:
+                result.blocks.append(shared_memory.SharedMemory(name=future.result()[0]))
+        result.close()
+        raise
+
+    return result
+
+
+def record_chunk(name: str, first_index: int, parameter_sets: list, directory, integrator=None, resume=False) -> list:
+    module = importlib.import_module(f"{__package__}.{name}")
+
+    paths = []
+    for index, variables in enumerate(parameter_sets, first_index):
+        simulation = module.Simulation()
+        simulation.update_variables(variables)
+        paths.append(pathlib.Path(directory) / f"{index:06}.traj")
+        record(simulation, paths[-1], integrator, resume=resume)
+
+    return paths
+
+
+def record_sweep(
+    name: str, parameter_sets: list, directory, workers=None, chunk_size=None, integrator=None, resume=False
+) -> list:
+    """Simulates every parameter set like run_sweep(), writing each run to its own trajectory file in directory
+
+    Runs are streamed to disk, so neither the workers nor this process hold more than a block of states. Returns the
+    paths in the order of parameter_sets, which can be opened with trajectory_file.TrajectoryFile. With resume, a sweep
+    that was interrupted is picked up again: complete runs are kept and unfinished ones continue from their checkpoint.
+    """
+    parameter_sets = list(parameter_sets)
+    workers = workers or os.cpu_count() or 1
+    chunk_size = chunk_size or max(1, math.ceil(len(parameter_sets) / (workers * 4)))
+    pathlib.Path(directory).mkdir(parents=True, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                record_chunk, name, start, parameter_sets[start : start + chunk_size], directory, integrator, resume
+            )
+            for start in range(0, len(parameter_sets), chunk_size)
+        ]
+        return [path for future in futures for path in future.result()]
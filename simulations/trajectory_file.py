@@ -0,0 +1,235 @@
+"""Binary trajectory files, written block by block and read back through np.memmap without loading them
+
+A .traj file is laid out as
+
+    magic     8 bytes, b"SIMTRAJ1"
+    rows      unsigned 64 bit little endian integer, the number of states written so far
+    size      unsigned 64 bit little endian integer, the size of the header
+    header    JSON describing the run, padded with spaces so the states start on a 64 byte boundary
+    states    rows x columns little endian values of the header's dtype, float64 or float32, in C order
+    trailer   JSON with the events of the run and the time of its last state, written when the run ends
+
+rows is updated after every block, so a file can be read while it is still being written. While a run is recorded by
+record() its checkpoint is saved next to the file every CHECKPOINT_EVERY states, so an interrupted run can be resumed.
+"""
+
+import json
+import pathlib
+from contextlib import ExitStack
+
+import numpy as np
+
+from . import checkpoint as checkpoints
+from .simulation import STREAM_CHUNK
+
+MAGIC = b"SIMTRAJ1"
+PREFIX_SIZE = len(MAGIC) + 16
+ALIGNMENT = 64
+
+
+def describe(simulation, integrator=None) -> dict:
+    # Runs without an integrator given are sampled from their closed form solution when there is one
+    exact = integrator is None and simulation.ANALYTIC
+    exact = exact and simulation.exact_solution(simulation.initial_conditions(), simulation) is not None
+
+    return {
+        "simulation": f"{type(simulation).__module__}.{type(simulation).__qualname__}",
+        "name": simulation.name,
+        "columns": simulation.column_names(),
+        "units": [column["unit"] for column in simulation.schema()] or [""] * simulation.state_length,
+        "dtype": simulation.state_dtype().newbyteorder("<").str,
+        "integrator": "exact" if exact else integrator or simulation.INTEGRATOR,
+        "sims_per_second": simulation.SIMS_PER_SECOND,
+        "parameters": {name: field["value"] for name, field in simulation.get_fields().items()},
+        "attributes": simulation.parameter_values(),
+    }
+
+
+class TrajectoryWriter:
+    def __init__(self, path: pathlib.Path, simulation, integrator=None, rows=None):
+        # Given rows, an unfinished file of the same run is continued after its first rows states instead
+        self.path = pathlib.Path(path)
+        self.simulation = simulation
+        self.header = describe(simulation, integrator)
+        self.columns = len(self.header["columns"])
+
+        if rows is not None:
+            self.resume(rows)
+            return
+
+        self.rows = 0
+
+        text = json.dumps(self.header).encode()
+        size = -(-(PREFIX_SIZE + len(text)) // ALIGNMENT) * ALIGNMENT - PREFIX_SIZE
+        text = text.ljust(size)
+
+        # Closed again if writing the header fails, otherwise kept open until close()
+        with ExitStack() as stack:
+            self.file = stack.enter_context(open(self.path, "wb"))
+            self.file.write(MAGIC + self.rows.to_bytes(8, "little") + size.to_bytes(8, "little") + text)
+            stack.pop_all()
+
+    def resume(self, rows: int) -> None:
+        existing = TrajectoryFile(self.path)
+        if existing.header != json.loads(json.dumps(self.header)):
+            raise ValueError(f"{self.path} is a recording of another run")
+        if rows > existing.rows:
+            raise ValueError(f"{self.path} has {existing.rows} states, fewer than the {rows} to resume after")
+
+        # States written after the checkpoint are dropped, they are simulated again
+        self.rows = rows
+        with ExitStack() as stack:
+            self.file = stack.enter_context(open(self.path, "r+b"))
+            self.file.truncate(existing.offset + rows * self.columns * np.dtype(self.header["dtype"]).itemsize)
+            self.file.seek(len(MAGIC))
+            self.file.write(self.rows.to_bytes(8, "little"))
+            self.file.seek(0, 2)
+            stack.pop_all()
+
+    def write(self, states) -> None:
+        self.file.write(np.ascontiguousarray(states, dtype=self.header["dtype"]).tobytes())
+        self.rows += len(states)
+
+        # Written after the states, so a reader never sees rows that aren't there yet
+        self.file.flush()
+        position = self.file.tell()
+        self.file.seek(len(MAGIC))
+        self.file.write(self.rows.to_bytes(8, "little"))
+        self.file.seek(position)
+        self.file.flush()
+
+    def close(self) -> None:
+        if self.file.closed:
+            return
+
+        end_time = self.simulation.terminal_time()
+        if end_time is None:
+            end_time = (self.rows - 1) / self.simulation.SIMS_PER_SECOND
+
+        events = [{**event, "state": np.asarray(event["state"]).tolist()} for event in self.simulation.events]
+        self.file.write(json.dumps({"events": events, "end_time": end_time}).encode())
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        # A run that raised is left without a trailer, as a file still being written, so it can be resumed
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+
+class TrajectoryFile:
+    """A .traj file opened for reading, with its states as a read only np.memmap
+
+    Indexing and slicing states only reads the pages touched, so runs larger than memory can be scrubbed through.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = pathlib.Path(path)
+
+        with open(self.path, "rb") as file:
+            prefix = file.read(PREFIX_SIZE)
+            if len(prefix) < PREFIX_SIZE or prefix[: len(MAGIC)] != MAGIC:
+                raise ValueError(f"{self.path} is not a trajectory file")
+
+            self.rows = int.from_bytes(prefix[len(MAGIC) : len(MAGIC) + 8], "little")
+            size = int.from_bytes(prefix[len(MAGIC) + 8 :], "little")
+            self.header = json.loads(file.read(size))
+
+            self.offset = PREFIX_SIZE + size
+            self.columns = len(self.header["columns"])
+            itemsize = np.dtype(self.header["dtype"]).itemsize
+
+            file.seek(self.offset + self.rows * self.columns * itemsize)
+            trailer = file.read()
+
+        # A file still being written has no trailer yet, but may have part of its next block
+        try:
+            self.trailer = json.loads(trailer)
+            self.complete = True
+        except ValueError:
+            self.trailer = {"events": [], "end_time": None}
+            self.complete = False
+
+        if self.rows:
+            self.states = np.memmap(self.path, self.header["dtype"], "r", self.offset, (self.rows, self.columns))
+        else:
+            self.states = np.empty((0, self.columns), dtype=self.header["dtype"])
+
+    @property
+    def events(self) -> list:
+        return [{**event, "state": np.array(event["state"])} for event in self.trailer["events"]]
+
+    @property
+    def times(self) -> np.ndarray:
+        times = np.arange(self.rows) / self.header["sims_per_second"]
+        if self.rows and self.trailer["end_time"] is not None:
+            times[-1] = self.trailer["end_time"]
+        return times
+
+    def column(self, name: str) -> np.ndarray:
+        return self.states[:, self.header["columns"].index(name)]
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def __getitem__(self, index):
+        return self.states[index]
+
+
+def record(
+    simulation,
+    path: pathlib.Path,
+    integrator=None,
+    chunk_size: int = STREAM_CHUNK,
+    resume: bool = False,
+    checkpoint_every: int = checkpoints.CHECKPOINT_EVERY,
+) -> TrajectoryFile:
+    """Simulates straight into a file, so only one block of the run is in memory at a time
+
+    The checkpoint of the run is saved next to the file every checkpoint_every states and removed when it is complete.
+    With resume, a complete recording of the same run at path is returned as it is and an interrupted one continues
+    from its last checkpoint, anything else is recorded from the start.
+    """
+    path = pathlib.Path(path)
+    checkpoint_file = checkpoints.checkpoint_path(path)
+    resume_from = None
+
+    if resume and path.exists():
+        try:
+            existing = TrajectoryFile(path)
+        except ValueError:
+            existing = None
+
+        if existing is not None and existing.complete:
+            if existing.header == json.loads(json.dumps(describe(simulation, integrator))):
+                return existing
+        elif existing is not None:
+            resume_from = checkpoints.load(checkpoint_file)
+
+    if resume_from is not None:
+        try:
+            checkpoints.check(simulation, resume_from, integrator)
+            writer = TrajectoryWriter(path, simulation, integrator, rows=resume_from["rows"])
+            states = simulation.stream(None, integrator, chunk_size, resume=resume_from)
+        except ValueError:  # a checkpoint of another run
+            resume_from = None
+
+    if resume_from is None:
+        writer = TrajectoryWriter(path, simulation, integrator)
+        states = simulation.stream(simulation.initial_conditions(), integrator, chunk_size)
+
+    with writer:
+        saved = writer.rows
+        for chunk in states:
+            writer.write(chunk)
+
+            if checkpoint_every and writer.rows - saved >= checkpoint_every:
+                checkpoints.save(checkpoint_file, simulation.checkpoint)
+                saved = writer.rows
+
+    checkpoint_file.unlink(missing_ok=True)
+    return TrajectoryFile(path)
@@ -1,12 +1,28 @@
 """Simulation of two objects connected by two springs"""
 
+from typing import ClassVar
+
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib import animation
+
 from .simulation import BaseSimulation  # type: ignore
 
 
 class Simulation(BaseSimulation):
+    PARAMETERS: ClassVar[dict] = {
+        "gravity": "G_EARTH",
+        "spring_length": "SPRING_LENGTH",
+        "bob_mass": "BOB_MASS",
+        "spring_constant": "SPRING_CONSTANT",
+    }
+    POSITIONS: ClassVar[list] = [0, 2]
+    VELOCITIES: ClassVar[list] = [1, 3]
+    SCHEMA: ClassVar[list] = [
+        {"name": "y1", "label": "Y Position of Top Bob", "unit": "m"},
+        {"name": "vy1", "label": "Y Velocity of Top Bob", "unit": "m/s"},
+        {"name": "y2", "label": "Y Position of Bottom Bob", "unit": "m"},
+        {"name": "vy2", "label": "Y Velocity of Bottom Bob", "unit": "m/s"},
+    ]
+
     def __init__(self):
         super().__init__("Two Springs", 4)
 
@@ -14,7 +30,7 @@ class Simulation(BaseSimulation):
         self.SPRING_CONSTANT = 1  # spring constant of the string in N/m
         self.SPRING_LENGTH = 10  # length of the string in m
 
-        self.state = np.zeros((1, self.state_length))  # y1, vy1, y2, vy2
+        self.INTEGRATOR = "velocity_verlet"
 
     def initial_conditions(self):
         state = np.zeros(self.state_length)
@@ -24,39 +40,89 @@ class Simulation(BaseSimulation):
         state[2] = self.SPRING_LENGTH * 2  # y position of the bottom particle
         state[3] = 0  # y velocity of the bottom particle
 
-        self.state[0] = state
+        self.trajectory.start(state)
 
         return state
 
-    def simulate(self, initial_state):
-        state = np.copy(initial_state)
-        simulation = [np.copy(state)]
+    def batch_initial_conditions(self, params, size):
+        state = np.zeros((size, self.state_length))
 
-        for i in range(self.SIM_LENGTH * self.SIMS_PER_SECOND):
-            state[0] += state[1] / self.SIMS_PER_SECOND
-            state[1] -= (
-                -self.G_EARTH + (self.SPRING_CONSTANT / self.BOB_MASS) * (2 * state[0] - state[2])
-            ) / self.SIMS_PER_SECOND
-            state[2] += state[3] / self.SIMS_PER_SECOND
-            state[3] -= (
-                -self.G_EARTH - (self.SPRING_CONSTANT / self.BOB_MASS) * (state[0] - state[2] + self.SPRING_LENGTH)
-            ) / self.SIMS_PER_SECOND
+        state[:, 0] = params.SPRING_LENGTH
+        state[:, 2] = params.SPRING_LENGTH * 2
+
+        return state
 
-            if abs(state[0]) > self.SPRING_LENGTH * 10 or abs(state[2]) > self.SPRING_LENGTH * 10:
-                break
-            if i > self.MAX_SIMS:
-                break
+    def derivatives(self, t, state, params):
+        derivatives = np.empty_like(state)
 
-            simulation.append(np.copy(state))
-            self.state = np.vstack([self.state, state])
+        derivatives[..., 0] = state[..., 1]
+        derivatives[..., 1] = params.G_EARTH - (params.SPRING_CONSTANT / params.BOB_MASS) * (
+            2 * state[..., 0] - state[..., 2]
+        )
+        derivatives[..., 2] = state[..., 3]
+        derivatives[..., 3] = params.G_EARTH + (params.SPRING_CONSTANT / params.BOB_MASS) * (
+            state[..., 0] - state[..., 2] + params.SPRING_LENGTH
+        )
+
+        return derivatives
+
+    def exact_solution(self, initial_state, params):
+        # The equations are linear, so the motion about the equilibrium is a sum of the two normal modes of
+        # y'' = -(k / m) A y, with mode shapes and frequencies from the eigendecomposition of A
+        eigenvalues, modes = np.linalg.eigh([[2.0, -1.0], [-1.0, 1.0]])
+
+        stretch = params.G_EARTH * params.BOB_MASS / params.SPRING_CONSTANT
+        equilibrium = [2 * stretch + params.SPRING_LENGTH, 3 * stretch + 2 * params.SPRING_LENGTH]
+
+        positions = [initial_state[..., 0] - equilibrium[0], initial_state[..., 2] - equilibrium[1]]
+        velocities = [initial_state[..., 1], initial_state[..., 3]]
+
+        frequencies = [np.sqrt(params.SPRING_CONSTANT / params.BOB_MASS * value) for value in eigenvalues]
+        amplitudes = [modes[0, i] * positions[0] + modes[1, i] * positions[1] for i in range(2)]
+        rates = [modes[0, i] * velocities[0] + modes[1, i] * velocities[1] for i in range(2)]
+
+        def states_at(t):
+            cosines = [np.cos(frequencies[i] * t) for i in range(2)]
+            sines = [np.sin(frequencies[i] * t) for i in range(2)]
+
+            coordinates = [amplitudes[i] * cosines[i] + rates[i] / frequencies[i] * sines[i] for i in range(2)]
+            speeds = [rates[i] * cosines[i] - amplitudes[i] * frequencies[i] * sines[i] for i in range(2)]
+
+            return np.stack(
+                [
+                    equilibrium[0] + modes[0, 0] * coordinates[0] + modes[0, 1] * coordinates[1],
+                    modes[0, 0] * speeds[0] + modes[0, 1] * speeds[1],
+                    equilibrium[1] + modes[1, 0] * coordinates[0] + modes[1, 1] * coordinates[1],
+                    modes[1, 0] * speeds[0] + modes[1, 1] * speeds[1],
+                ],
+                axis=-1,
+            )
+
+        return states_at, None
+
+    def invariants(self, states, times) -> dict:
+        # y points down, so gravity's potential falls as the bobs drop
+        top, bottom = states[..., 0], states[..., 2]
+        kinetic = 0.5 * self.BOB_MASS * (states[..., 1] ** 2 + states[..., 3] ** 2)
+        stretches = [top - self.SPRING_LENGTH, bottom - top - self.SPRING_LENGTH]
+        springs = 0.5 * self.SPRING_CONSTANT * (stretches[0] ** 2 + stretches[1] ** 2)
+        gravity = -self.BOB_MASS * self.G_EARTH * (top + bottom)
+
+        return {
+            "spring_energy": {"label": "Spring Potential Energy", "unit": "J", "values": springs, "conserved": False},
+            "energy": {"label": "Total Energy", "unit": "J", "values": kinetic + springs + gravity, "conserved": True},
+        }
 
-        return np.array(simulation)
+    def stopped(self, state, params):
+        return (abs(state[..., 0]) > params.SPRING_LENGTH * 10) | (abs(state[..., 2]) > params.SPRING_LENGTH * 10)
 
     def axis_size(self):
         return self.SPRING_LENGTH * 10
 
     def get_figure(self):
-        simulation = self.simulate(self.initial_conditions())
+        import matplotlib.pyplot as plt
+
+        simulation = self.playback_states()
 
         fig = plt.figure()
         top_bob = plt.scatter(0, self.state[0, 0], s=100, zorder=10)
@@ -70,31 +136,34 @@ class Simulation(BaseSimulation):
         (top_spring,) = ax.plot([], [], lw=1.5)
         (bottom_spring,) = ax.plot([], [], lw=1.5)
 
-        def create_spring(start_y, end_y):
-            spring_points = 100
-            y_vals = np.linspace(start_y, end_y, spring_points)
-            x_vals = np.sin(np.linspace(0, 2 * np.pi * 10, spring_points)) * 1
-            return x_vals, y_vals
+        # A spring is the same zigzag stretched between its ends, so only its heights change between frames. Storing
+        # the full polylines of every frame would take 100 points per spring per frame, so they are stretched when drawn
+        spring_points = 100
+        spring_x = np.sin(np.linspace(0, 2 * np.pi * 10, spring_points))
+        spring_fraction = np.linspace(0, 1, spring_points)
 
-        def animate_func(i):
-            self.offset = i
+        bob_offsets = np.zeros((len(simulation), 2, 2))
+        bob_offsets[:, 0, 1] = simulation[:, 0]
+        bob_offsets[:, 1, 1] = simulation[:, 2]
 
-            top_bob.set_offsets([0, simulation[:, [0, 1]][i, 0]])
-            bottom_bob.set_offsets([0, simulation[:, [2, 3]][i, 0]])
+        top_spring.set_data(spring_x, np.zeros(spring_points))
+        bottom_spring.set_data(spring_x, np.zeros(spring_points))
+
+        def animate_func(i):
+            top_bob.set_offsets(bob_offsets[i, 0])
+            bottom_bob.set_offsets(bob_offsets[i, 1])
 
-            top_spring.set_data(*create_spring(0, simulation[i, 0]))
-            bottom_spring.set_data(*create_spring(simulation[i, 0], simulation[i, 2]))
+            top_spring.set_ydata(spring_fraction * simulation[i, 0])
+            bottom_spring.set_ydata(simulation[i, 0] + spring_fraction * (simulation[i, 2] - simulation[i, 0]))
 
             return top_bob, bottom_bob, top_spring, bottom_spring
 
-        anim = animation.FuncAnimation(
-            fig, animate_func, frames=range(len(simulation)), interval=(1000 / self.SIMS_PER_SECOND)
-        )
+        anim = self.animate(fig, animate_func, len(simulation))
 
         return fig, anim
 
     def update_variables(self, variables) -> bool:
-        self.state = np.zeros((1, self.state_length))
+        self.trajectory.reset()
         if "gravity" in variables:
             self.G_EARTH = float(variables["gravity"])
         if "spring_length" in variables:
@@ -125,18 +194,3 @@ class Simulation(BaseSimulation):
         }
 
         return fields
-
-    def get_readings(self) -> dict:
-        try:
-            state = self.state[self.offset]
-        except IndexError:
-            state = self.state[-1]
-
-        readings = {
-            "y1": {"label": "Y Position of Top Bob", "value": round(state[0], self.ROUND)},
-            "vy1": {"label": "Y Velocity of Top Bob", "value": round(state[1], self.ROUND)},
-            "y2": {"label": "Y Position of Bottom Bob", "value": round(state[2], self.ROUND)},
-            "vy2": {"label": "Y Velocity of Bottom Bob", "value": round(state[3], self.ROUND)},
-        }
-
-        return readings
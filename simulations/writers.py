@@ -0,0 +1,98 @@
+"""Writers that save a trajectory block by block as it is simulated, for runs too long to keep in memory
+
+Chunks from Simulation.stream() are written as they arrive:
+
+    with open_writer(path, simulation) as writer:
+        for chunk in simulation.stream(simulation.initial_conditions()):
+            writer.write(chunk)
+"""
+
+import pathlib
+from contextlib import ExitStack
+
+import numpy as np
+
+from .trajectory_file import TrajectoryWriter
+
+
+def csv_header(simulation) -> str:
+    # Column names with their units, e.g. "x [m],y [m],vx [m/s],vy [m/s]"
+    columns = simulation.schema() or [{"name": name, "unit": ""} for name in simulation.column_names()]
+    return ",".join(f"{column['name']} [{column['unit']}]" if column["unit"] else column["name"] for column in columns)
+
+
+class Writer:
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CsvWriter(Writer):
+    def __init__(self, path: pathlib.Path, simulation, integrator=None):
+        self.columns = simulation.state_length
+        self.rows = 0
+
+        # Closed again if writing the header fails, otherwise kept open until close()
+        with ExitStack() as stack:
+            self.file = stack.enter_context(open(path, "w"))
+            self.file.write(f"# {csv_header(simulation)}\n")
+            stack.pop_all()
+
+    def write(self, states) -> None:
+        np.savetxt(self.file, states, delimiter=",")
+        self.rows += len(states)
+
+
+class NpyWriter(Writer):
+    """Writes a .npy file whose header is rewritten with the final number of rows on close
+
+    The header is padded to a fixed length, so rewriting it never moves the states after it.
+    """
+
+    HEADER_LENGTH = 128  # a multiple of 64 as the format asks, with room for any 2D shape
+    MAGIC = b"\x93NUMPY\x01\x00"
+
+    def __init__(self, path: pathlib.Path, simulation, integrator=None):
+        self.columns = simulation.state_length
+        self.dtype = simulation.state_dtype().newbyteorder("<")
+        self.rows = 0
+
+        with ExitStack() as stack:
+            self.file = stack.enter_context(open(path, "wb"))
+            self.file.write(self.header())
+            stack.pop_all()
+
+    def header(self) -> bytes:
+        description = {"descr": self.dtype.str, "fortran_order": False, "shape": (self.rows, self.columns)}
+        text = repr(description).encode("latin1")
+
+        # Version 1.0 headers are the magic string, a two byte length, then the description padded with spaces
+        padding = self.HEADER_LENGTH - len(self.MAGIC) - 2 - len(text) - 1
+        text += b" " * padding + b"\n"
+        return self.MAGIC + len(text).to_bytes(2, "little") + text
+
+    def write(self, states) -> None:
+        self.file.write(np.ascontiguousarray(states, dtype=self.dtype).tobytes())
+        self.rows += len(states)
+
+    def close(self) -> None:
+        if not self.file.closed:
+            self.file.seek(0)
+            self.file.write(self.header())
+        self.file.close()
+
+
+WRITERS = {".csv": CsvWriter, ".npy": NpyWriter, ".traj": TrajectoryWriter}
+
+
+def open_writer(path: pathlib.Path, simulation, integrator=None):
+    path = pathlib.Path(path)
+    if path.suffix not in WRITERS:
+        raise ValueError(f"Can't stream to {path.name}, expected a file ending in one of {', '.join(WRITERS)}")
+
+    return WRITERS[path.suffix](path, simulation, integrator)